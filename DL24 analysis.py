@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+Offline analysis of many discharge logs recorded by
+"DL24 electronic load V0.5.py" (the CSV format written by collect_data,
+also combined logs with a port column). Every file is analysed by its own
+worker process, read in chunks of lines that are parsed and reduced with
+numpy, so throughput scales with the number of cores and memory stays flat
+however long a log is. Only numpy is needed, not the dl24 package.
+
+Per file (and port) the summary table has:
+  capacity_mah / energy_wh   trapezoidal integral of current / power over time
+  device_mah / device_wh     what the DL24 counted (increments, resets skipped)
+  avg_voltage                energy / charge
+  ir_mohm                    median -dV/dI over current steps between adjacent
+                             samples (profiles, pulses, load switching on/off)
+  temp_rise                  maximum temperature minus the first one
+
+python "DL24 analysis.py" logs/ --output summary.csv
+python "DL24 analysis.py" "run 1.csv" "run 2.csv" --jobs 4
+"""
+
+import os
+import csv
+import sys
+import glob
+import time
+import argparse
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+# The columns written by collect_data (CSV_HEADER of the application),
+# combined logs add 'port' at the end
+CSV_HEADER = ['date', 'voltage', 'current', 'Power', 'device_energy', 'device_charge', 'temp', 'time_seconds',
+              'time_str']
+COLUMNS = ['file', 'port', 'samples', 'start', 'end', 'hours', 'capacity_mah', 'device_mah', 'energy_wh',
+           'device_wh', 'avg_voltage', 'min_voltage', 'max_voltage', 'max_current', 'ir_mohm', 'ir_steps',
+           'temp_start', 'temp_max', 'temp_rise', 'error']
+CHUNK_BYTES = 8 * 1024 * 1024
+EPOCH = datetime.datetime(1970, 1, 1)  # the dates are parsed as naive local times
+
+
+class Accumulator:
+    """
+    The running totals of one log (one port of a combined log), fed chunk by
+    chunk in time order. The last sample of a chunk is kept so the
+    integrals and differences continue seamlessly into the next one.
+    """
+    MAX_GAP = 60.0    # s, longer intervals (restarts, resumed logs) are not integrated
+    MIN_STEP = 0.1    # A, current change between two samples taken as a step
+    MAX_STEP_DT = 2.0  # s between the samples around a step
+
+    def __init__(self):
+        self.samples = 0
+        self.start = self.end = None
+        self.last = None  # t, voltage, current, power, device_charge, device_energy
+        self.charge = self.energy = 0.0       # A*s, W*s
+        self.device_charge = self.device_energy = 0.0
+        self.min_voltage = np.inf
+        self.max_voltage = -np.inf
+        self.max_current = 0.0
+        self.temp_start = None
+        self.temp_max = -np.inf
+        self.resistances = []
+
+    def add(self, t, voltage, current, device_energy, device_charge, temp):
+        if not len(t):
+            return
+        power = voltage * current
+        if self.last is None:
+            self.start = t[0]
+            self.temp_start = temp[0]
+            self.last = (t[0], voltage[0], current[0], power[0], device_charge[0], device_energy[0])
+        t0, v0, i0, p0, charge0, energy0 = self.last
+        dt = np.diff(t, prepend=t0)
+        dv = np.diff(voltage, prepend=v0)
+        di = np.diff(current, prepend=i0)
+        integrate = dt <= self.MAX_GAP
+        self.charge += float(np.sum(((current + np.concatenate(([i0], current[:-1]))) * dt)[integrate])) / 2
+        self.energy += float(np.sum(((power + np.concatenate(([p0], power[:-1]))) * dt)[integrate])) / 2
+        # Device counters only count up; a drop is a reset
+        for name, values, previous in (("device_charge", device_charge, charge0),
+                                       ("device_energy", device_energy, energy0)):
+            increments = np.diff(values, prepend=previous)
+            setattr(self, name, getattr(self, name) + float(increments[increments > 0].sum()))
+        steps = (np.abs(di) >= self.MIN_STEP) & (dt <= self.MAX_STEP_DT)
+        if steps.any():
+            r = -dv[steps] / di[steps]
+            self.resistances.append(r[(r > 0) & (r < 10.0)])
+
+        self.samples += len(t)
+        self.end = t[-1]
+        self.min_voltage = min(self.min_voltage, float(voltage.min()))
+        self.max_voltage = max(self.max_voltage, float(voltage.max()))
+        self.max_current = max(self.max_current, float(current.max()))
+        self.temp_max = max(self.temp_max, float(temp.max()))
+        self.last = (t[-1], voltage[-1], current[-1], power[-1], device_charge[-1], device_energy[-1])
+
+    def result(self):
+        if not self.samples:
+            return {'samples': 0, 'error': "no records"}
+        resistances = np.concatenate(self.resistances) if self.resistances else np.zeros(0)
+        capacity = self.charge / 3.6
+        energy = self.energy / 3600.0
+        return {'samples': self.samples,
+                'start': (EPOCH + datetime.timedelta(seconds=float(self.start))).strftime("%Y-%m-%d %H:%M:%S"),
+                'end': (EPOCH + datetime.timedelta(seconds=float(self.end))).strftime("%Y-%m-%d %H:%M:%S"),
+                'hours': f"{(self.end - self.start) / 3600:.3f}", 'capacity_mah': f"{capacity:.1f}",
+                'device_mah': f"{self.device_charge:.1f}", 'energy_wh': f"{energy:.3f}",
+                'device_wh': f"{self.device_energy:.3f}",
+                'avg_voltage': f"{energy / capacity * 1000:.3f}" if capacity > 0 else "",
+                'min_voltage': f"{self.min_voltage:.3f}", 'max_voltage': f"{self.max_voltage:.3f}",
+                'max_current': f"{self.max_current:.3f}",
+                'ir_mohm': f"{np.median(resistances) * 1000:.1f}" if len(resistances) else "",
+                'ir_steps': len(resistances), 'temp_start': f"{self.temp_start:.0f}",
+                'temp_max': f"{self.temp_max:.0f}", 'temp_rise': f"{self.temp_max - self.temp_start:.0f}"}
+
+
+def spread_seconds(seconds):
+    """
+    The log's dates have whole seconds; samples within the same second get
+    evenly spaced times inside it (periods below 1 s).
+    """
+    n = len(seconds)
+    starts = np.flatnonzero(np.diff(seconds, prepend=seconds[0] - 1) != 0)
+    counts = np.diff(np.append(starts, n))
+    rank = np.arange(n) - np.repeat(starts, counts)
+    return seconds + rank / np.repeat(counts, counts)
+
+
+def parse_chunk(lines, with_port):
+    """
+    Epoch seconds, the numeric columns and the ports (or None) of the
+    complete records among lines; repeated headers of appended runs and torn
+    lines are skipped.
+    """
+    commas = len(CSV_HEADER) - 1 + with_port
+    lines = [line for line in lines if line[:1].isdigit() and line.count(",") == commas]
+    if not lines:
+        return None
+    dates = np.array([line[:19] for line in lines], dtype="datetime64[s]").astype(np.int64)
+    values = np.loadtxt(lines, delimiter=",", usecols=(1, 2, 4, 5, 6), ndmin=2)
+    ports = np.array([line.rstrip("\r\n").rsplit(",", 1)[1] for line in lines]) if with_port else None
+    return dates, values, ports
+
+
+def analyze_file(path, chunk_bytes=CHUNK_BYTES):
+    """One worker: the summary rows of one log (one per port) and its record count."""
+    accumulators = {}
+    try:
+        with open(path, newline="") as f:
+            header = f.readline().strip().split(",")
+            with_port = header == CSV_HEADER + ['port']
+            if header != CSV_HEADER and not with_port:
+                return [{'file': path, 'error': "not a DL24 log"}], 0
+            held = None  # the records of the chunk's last second, completed by the next chunk
+            while True:
+                lines = f.readlines(chunk_bytes)
+                parsed = parse_chunk(lines, with_port) if lines else None
+                if held is not None:
+                    parsed = held if parsed is None else tuple(
+                        None if a is None else np.concatenate((a, b)) for a, b in zip(held, parsed))
+                    held = None
+                if parsed is None:
+                    if not lines:
+                        break
+                    continue
+                dates, values, ports = parsed
+                if lines:
+                    keep = np.searchsorted(dates, dates[-1])
+                    if keep > 0:
+                        held = tuple(None if a is None else a[keep:] for a in parsed)
+                        dates, values, ports = (None if a is None else a[:keep] for a in parsed)
+                groups = [(None, slice(None))] if ports is None else [(port, ports == port)
+                                                                      for port in np.unique(ports)]
+                for port, rows in groups:
+                    t = spread_seconds(dates[rows])
+                    v = values[rows]
+                    accumulators.setdefault(port, Accumulator()).add(t, v[:, 0], v[:, 1], v[:, 2], v[:, 3],
+                                                                     v[:, 4])
+                if not lines:
+                    break
+    except (OSError, ValueError, UnicodeDecodeError) as e:
+        return [{'file': path, 'error': str(e)}], 0
+    if not accumulators:
+        accumulators[None] = Accumulator()
+    rows = [dict(accumulator.result(), file=path, port=port or "") for port, accumulator in accumulators.items()]
+    return rows, sum(accumulator.samples for accumulator in accumulators.values())
+
+
+def find_logs(paths):
+    """Files, globs and directories (searched recursively for *.csv)."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(glob.glob(os.path.join(path, "**", "*.csv"), recursive=True))
+        else:
+            found.extend(glob.glob(path) or [path])
+    return sorted(set(found))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summary table of many DL24 discharge logs")
+    parser.add_argument("paths", nargs="+", help="CSV logs, globs or directories")
+    parser.add_argument("--output", default="DL24 analysis.csv", help="summary CSV (default 'DL24 analysis.csv')")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-mb", type=float, default=CHUNK_BYTES / 1e6, help="lines read per chunk, in MB")
+    args = parser.parse_args(argv)
+    paths = [path for path in find_logs(args.paths) if os.path.abspath(path) != os.path.abspath(args.output)]
+    if not paths:
+        print("No logs found")
+        return
+
+    t0 = time.perf_counter()
+    results = []
+    total_rows = 0
+    total_bytes = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+    chunk_bytes = max(int(args.chunk_mb * 1e6), 4096)
+    with ProcessPoolExecutor(max_workers=max(args.jobs, 1)) as pool:
+        # One file per task, results come back in the order of paths
+        for rows, count in pool.map(analyze_file, paths, [chunk_bytes] * len(paths)):
+            results.extend(rows)
+            total_rows += count
+    elapsed = time.perf_counter() - t0
+
+    try:
+        with open(args.output, "w", newline="") as f:
+            wr = csv.DictWriter(f, COLUMNS)
+            wr.writeheader()
+            wr.writerows(results)
+    except OSError as e:
+        print(f"Error while writing {args.output}: {e}")
+
+    print(f"{'file':<40} {'port':<6} {'hours':>8} {'mAh':>9} {'Wh':>8} {'avg V':>7} {'IR mOhm':>8} {'dT':>4}")
+    for row in results:
+        name = os.path.basename(row['file'])
+        if row.get('error'):
+            print(f"{name[-40:]:<40} {row.get('port', ''):<6} {row['error']}")
+            continue
+        print(f"{name[-40:]:<40} {row['port']:<6} {row['hours']:>8} {row['capacity_mah']:>9} {row['energy_wh']:>8} "
+              f"{row['avg_voltage']:>7} {row['ir_mohm'] or '-':>8} {row['temp_rise']:>4}")
+    print(f"{len(paths)} file(s), {total_rows} records, {total_bytes / 1e6:.1f} MB in {elapsed:.2f} s "
+          f"({total_rows / elapsed if elapsed else 0:.0f} records/s, {max(args.jobs, 1)} worker(s)) "
+          f"-> {args.output}")
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the acquisition, logging and plotting pipeline of
+"DL24 electronic load V0.5.py" with synthetic data. No DL24, no display:
+the plot is rendered on a plain Agg canvas, so this runs on any Linux box.
+
+Stages, for every sample rate and run length:
+  drain    App._drain_device: SampleBuffer hand-off, batch integration,
+           series store, console lines (sent to /dev/null)
+  render   PlotPanel.update (decimation + blitting) with the store already
+           holding the whole run
+  csv      App.collect_data into a CsvLog on a temporary file
+           (independent of run length, so measured once per rate)
+
+Every GUI tick (1 / App.max_fps seconds) brings rate / max_fps new samples.
+Reported: throughput, latency percentiles per call and tracemalloc peak
+memory of the stage.
+
+python "DL24 benchmark.py"
+python "DL24 benchmark.py" --rates 10,100 --lengths 1h,1d --ticks 100 --json bench.json
+"""
+
+import os
+import sys
+import io
+import time
+import json
+import argparse
+import datetime
+import tempfile
+import tracemalloc
+import contextlib
+import importlib.util
+
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.ticker import FormatStrFormatter
+from matplotlib.figure import Figure
+import matplotlib.dates as mdates
+
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DL24 electronic load V0.5.py")
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def load_app():
+    """Import the application file (its name is not a valid module name)."""
+    spec = importlib.util.spec_from_file_location("dl24_app", APP_PATH)
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    # What _import_gui() would provide, minus Tk
+    app.np, app.mdates, app.Figure, app.FormatStrFormatter = np, mdates, Figure, FormatStrFormatter
+    app.FigureCanvasTkAgg = AggCanvas
+    return app
+
+
+class AggWidget:
+    """Stands in for the Tk widget of the canvas."""
+    def __init__(self, canvas):
+        self.canvas = canvas
+
+    def winfo_width(self):
+        return int(self.canvas.figure.bbox.width)
+
+    def winfo_viewable(self):
+        return True
+
+    def grid(self, *args, **kwargs):
+        pass
+
+
+class AggCanvas(FigureCanvasAgg):
+    """FigureCanvasTkAgg replacement: renders with Agg, never shows anything."""
+    def __init__(self, figure, master=None):
+        super().__init__(figure)
+
+    def get_tk_widget(self):
+        return AggWidget(self)
+
+
+class Synthetic:
+    """
+    A 1 A constant-current discharge sampled at `rate` Hz: slowly falling
+    voltage with a little ripple, device counters counting up.
+    """
+    def __init__(self, rate, start=datetime.datetime(2024, 1, 1)):
+        self.rate = rate
+        self.start = start
+        self.mono0 = 1000.0
+
+    def arrays(self, first, count):
+        k = np.arange(first, first + count, dtype=float)
+        seconds = k / self.rate
+        current = 1.0 + 0.002 * np.sin(k * 0.37)
+        voltage = 4.15 - 0.9 * seconds / (seconds + 20000.0) + 0.003 * np.sin(k * 0.11)
+        return {"seconds": seconds, "mono": self.mono0 + seconds, "voltage": voltage, "current": current,
+                "charge": seconds / 3.6, "energy": seconds * 3.7 / 3600.0, "temp": 25.0 + seconds / 86400.0}
+
+    def snapshots(self, app, first, count):
+        a = self.arrays(first, count)
+        return [app.Snapshot(self.start + datetime.timedelta(seconds=float(s)), m, v, i, temp, e, q,
+                             datetime.timedelta(seconds=int(s)))
+                for s, m, v, i, temp, e, q in zip(a["seconds"], a["mono"], a["voltage"], a["current"],
+                                                  a["temp"], a["energy"], a["charge"])]
+
+
+def make_bench_app(app):
+    """The sample processing methods of App on an object without Tk."""
+    class BenchApp:
+        _drain_device = app.App._drain_device
+        _process_batch = app.App._process_batch
+        collect_data = app.App.collect_data
+
+        def __init__(self, device):
+            self.devices = {device.port: device}
+            self.drain_chunk = 500
+    return BenchApp
+
+
+class BenchDevice:
+    """The attributes of DL24Device the processing path uses."""
+    def __init__(self, app, log=None):
+        self.port = "BENCH"
+        self.data_queue = app.SampleBuffer()
+        self.integrator = app.Integrator()
+        self.stats = app.LiveStats()
+        self.sequence = None
+        self.log = log
+
+
+def prefill(app, plot, device, source, count, first=0, chunk=1_000_000):
+    """Integrate `count` samples and put them into the plot store, vectorized."""
+    for start in range(first, first + count, chunk):
+        a = source.arrays(start, min(chunk, first + count - start))
+        charge, energy = device.integrator.add(a["mono"], a["voltage"], a["current"], a["charge"], a["energy"])
+        dates = mdates.date2num(source.start) + a["seconds"] / 86400.0
+        plot.series.extend(date=dates, voltage=a["voltage"], current=a["current"], charge=charge, energy=energy)
+
+
+def stats(latencies, items, elapsed):
+    latencies = np.asarray(latencies) * 1000.0
+    return {"calls": len(latencies), "items": items, "throughput": items / elapsed if elapsed else 0.0,
+            "p50_ms": float(np.percentile(latencies, 50)), "p95_ms": float(np.percentile(latencies, 95)),
+            "p99_ms": float(np.percentile(latencies, 99)), "max_ms": float(latencies.max())}
+
+
+def bench_drain(app, rate, length, ticks, per_tick):
+    source = Synthetic(rate)
+    device = BenchDevice(app)
+    plot = app.PlotPanel(None, blit=True)
+    bench = make_bench_app(app)(device)
+    n = int(rate * length)
+    prefill(app, plot, device, source, n)
+    latencies = []
+    first = n
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        for tick in range(ticks):
+            device.data_queue.put(source.snapshots(app, first, per_tick))
+            first += per_tick
+            t0 = time.perf_counter()
+            bench._drain_device(device, plot, float("inf"))
+            latencies.append(time.perf_counter() - t0)
+    return stats(latencies, ticks * per_tick, sum(latencies))
+
+
+def bench_render(app, rate, length, ticks, per_tick):
+    source = Synthetic(rate)
+    device = BenchDevice(app)
+    plot = app.PlotPanel(None, blit=True)
+    n = int(rate * length)
+    prefill(app, plot, device, source, n)
+    plot.update()  # first fold of the whole run and the first full draw
+    latencies = []
+    first = n
+    for tick in range(ticks):
+        prefill(app, plot, device, source, per_tick, first=first)
+        first += per_tick
+        t0 = time.perf_counter()
+        plot.update()
+        latencies.append(time.perf_counter() - t0)
+    return stats(latencies, ticks, sum(latencies))
+
+
+def bench_csv(app, rate, ticks, per_tick, directory):
+    source = Synthetic(rate)
+    path = os.path.join(directory, f"bench {rate:g} Hz.csv")
+    log = app.CsvLog(path, False)
+    log.attach()
+    device = BenchDevice(app, log)
+    bench = make_bench_app(app)(device)
+    count = max(ticks * per_tick, 2000)
+    snaps = source.snapshots(app, 0, count)
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        t_start = time.perf_counter()
+        for snap in snaps:
+            t0 = time.perf_counter()
+            bench.collect_data(device, snap)
+            latencies.append(time.perf_counter() - t0)
+        # Throughput includes the writer thread getting everything to disk
+        log.detach()
+        log.join()
+        elapsed = time.perf_counter() - t_start
+    os.remove(path)
+    return stats(latencies, count, elapsed)
+
+
+def measure(function, *args):
+    """Run a stage once for timing, then once more under tracemalloc."""
+    result = function(*args)
+    tracemalloc.start()
+    try:
+        function(*args)
+        result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+    return result
+
+
+def parse_length(text):
+    text = text.strip()
+    if text[-1] in UNITS:
+        return float(text[:-1]) * UNITS[text[-1]]
+    return float(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DL24 pipeline benchmarks with synthetic data")
+    parser.add_argument("--rates", default="1,10,100", help="sample rates in Hz (default 1,10,100)")
+    parser.add_argument("--lengths", default="10m,1h,1d", help="run lengths, s/m/h/d suffix (default 10m,1h,1d)")
+    parser.add_argument("--ticks", type=int, default=200, help="GUI ticks measured per case (default 200)")
+    parser.add_argument("--max-fps", type=float, default=5, help="GUI ticks per second (default 5, as App)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args(argv)
+    rates = [float(rate) for rate in args.rates.split(",")]
+    lengths = [(text.strip(), parse_length(text)) for text in args.lengths.split(",")]
+
+    app = load_app()
+    run = (lambda function, *a: function(*a)) if args.no_memory else measure
+    results = []
+    print(f"{'stage':<7} {'rate':>6} {'length':>7} {'samples':>10} {'throughput':>14} "
+          f"{'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'peak':>9}")
+
+    def show(stage, rate, length, samples, result, unit):
+        result.update(stage=stage, rate_hz=rate, length=length, samples=samples)
+        results.append(result)
+        peak = f"{result['peak_mb']:7.1f}MB" if "peak_mb" in result else ""
+        print(f"{stage:<7} {rate:>4g}Hz {length:>7} {samples:>10} {result['throughput']:>9.0f} {unit:<4} "
+              f"{result['p50_ms']:>6.2f}ms {result['p95_ms']:>6.2f}ms {result['p99_ms']:>6.2f}ms "
+              f"{result['max_ms']:>6.2f}ms {peak:>9}")
+        sys.stdout.flush()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for rate in rates:
+            per_tick = max(int(round(rate / args.max_fps)), 1)
+            for text, length in lengths:
+                samples = int(rate * length)
+                show("drain", rate, text, samples, run(bench_drain, app, rate, length, args.ticks, per_tick), "S/s")
+                show("render", rate, text, samples, run(bench_render, app, rate, length, args.ticks, per_tick), "fps")
+            show("csv", rate, "-", max(args.ticks * per_tick, 2000),
+                 run(bench_csv, app, rate, args.ticks, per_tick, directory), "rows")
+
+    try:
+        import resource
+        print(f"Peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    except ImportError:
+        pass
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,22 +5,2574 @@ Created on Thu Sep 14 19:04:29 2023
 @author: Leo
 
 pip install -U git+https://github.com/KrystianD/dl24-electronic-load
+
+Without a display (tkinter and matplotlib are then not imported):
+python "DL24 electronic load V0.5.py" --headless --port COM6 --period 1 --output run.csv
 """
 
-import tkinter as tk
-from tkinter import ttk, filedialog
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import os
-import csv
-import datetime
-import time
-from dl24 import DL24
-from matplotlib.ticker import FormatStrFormatter
-import threading
-import queue
-from matplotlib.figure import Figure
+import time
+_STARTED = time.perf_counter()
+import os
+import csv
+import datetime
+import argparse
+import json
+import struct
+import mmap
+import bisect
+import math
+from array import array
+from dl24 import DL24
+import threading
+import queue
+import heapq
+import itertools
+import functools
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import namedtuple
+
+COM_Port = "COM6"
+
+
+def _import_gui():
+    """tkinter, matplotlib and numpy are only imported when the GUI is started."""
+    global tk, ttk, filedialog, FigureCanvasTkAgg, NavigationToolbar2Tk, FormatStrFormatter, Figure, mdates, np
+    import tkinter as tk
+    from tkinter import ttk, filedialog
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+    from matplotlib.ticker import FormatStrFormatter
+    from matplotlib.figure import Figure
+    import matplotlib.dates as mdates
+    import numpy as np
+
+
+class Snapshot(namedtuple("Snapshot", "t mono voltage current temp energy charge on_time")):
+    """
+    One immutable reading of all live DL24 channels. t (wall clock) and mono
+    (time.monotonic) are a single capture timestamp taken between the
+    voltage and current reads.
+    """
+    __slots__ = ()
+    
+    @property
+    def power(self):
+        return self.voltage * self.current
+
+
+def read_snapshot(dl24):
+    """
+    Read all live channels in one go. The DL24 protocol answers one value per
+    request, so this is the minimum of six transactions; voltage and current
+    are read back-to-back so they are as time-coherent as the link allows.
+    """
+    voltage = dl24.get_voltage()
+    mono = time.monotonic()
+    t = datetime.datetime.now()
+    current = dl24.get_current()
+    temp = dl24.get_temp()
+    energy = dl24.get_energy()   # Device-reported Wh
+    charge = dl24.get_charge()   # Device-reported mAh
+    on_time = dl24.get_time()
+    return Snapshot(t, mono, voltage, current, temp, energy, charge, on_time)
+
+
+def read_vi(dl24, seconds, mono, voltage, current, start=0, stop=None):
+    """
+    Read only voltage and current, back to back, for `seconds` into the
+    preallocated arrays from index start until stop (default: their end).
+    Nothing else happens in the loop. Returns the index after the last pair.
+    """
+    stop = len(mono) if stop is None else stop
+    get_voltage, get_current, clock = dl24.get_voltage, dl24.get_current, time.monotonic
+    end = clock() + seconds
+    n = start
+    while n < stop:
+        voltage[n] = get_voltage()
+        mono[n] = t = clock()
+        current[n] = get_current()
+        n += 1
+        if t >= end:
+            break
+    return n
+
+
+# CSV header: renamed columns to reflect these are device counters
+CSV_HEADER = [
+    'date', 'voltage', 'current', 'Power',
+    'device_energy', 'device_charge', 'temp',
+    'time_seconds', 'time_str'
+]
+
+
+def csv_row(snap):
+    """Format one Snapshot as a row matching CSV_HEADER."""
+    on_time = snap.on_time
+    days = on_time.days
+    seconds = on_time.seconds
+    hours = seconds // 3600
+    minutes = (seconds // 60) % 60
+    seconds = seconds % 60
+    time_sec = int(on_time.total_seconds())
+    time_str = f"{days:01d}d. {hours:02d}:{minutes:02d}:{seconds:02d}"
+
+    return [
+        snap.t.strftime("%Y-%m-%d %H:%M:%S"),
+        f"{snap.voltage:.3f}",
+        f"{snap.current:.3f}",
+        f"{snap.power:.2f}",
+        f"{snap.energy:.3f}",   # device-reported Wh
+        f"{snap.charge:.1f}",   # device-reported mAh
+        f"{snap.temp:.0f}",
+        f"{time_sec}",
+        time_str,
+    ]
+
+
+def console_line(snap, prefix=""):
+    """Console line with the device counters of one Snapshot."""
+    time_str = snap.t.strftime("%Y.%m.%d %H:%M:%S.%f")[:-4]  # discard last digits of microseconds
+    return (f"{prefix}{time_str} | {snap.voltage:6.03f} V | {snap.current:6.3f} A "
+            f"| {snap.power:6.2f} W | {snap.energy:6.3f} Wh "
+            f"| {snap.charge:7.1f} mAh | {snap.temp:4.1f} °C")
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram: counts[i] holds the values up to edges[i], the
+    last bucket everything above. Constant memory, O(log buckets) per value;
+    percentiles are approximate (the upper edge of their bucket).
+    """
+    def __init__(self, edges):
+        self.edges = tuple(edges)
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+    
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.edges, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+    
+    def percentile(self, p):
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= p / 100 * self.count:
+                return min(self.edges[i], self.max) if i < len(self.edges) else self.max
+        return 0.0
+    
+    def as_dict(self):
+        return {"count": self.count, "mean": self.total / self.count if self.count else 0.0,
+                "p50": self.percentile(50), "p95": self.percentile(95), "p99": self.percentile(99),
+                "max": self.max, "edges": list(self.edges), "counts": list(self.counts)}
+
+
+class Metrics:
+    """
+    Always-on hot-path instrumentation: one Histogram per stage, fed with
+    time.perf_counter() durations (seconds) or queue depths (samples) from
+    whichever thread runs the stage. Stages used here:
+    
+    serial          one DL24Session.call (device round trips, lock wait excluded)
+    csv write       one batch of the log writer (encode, write, flush/fsync)
+    csv backlog     items the log writer found queued per batch
+    display queue   samples waiting for the GUI when it starts draining
+    drain           one GUI drain pass over all devices
+    render          one plot update
+    """
+    TIME_EDGES = tuple(m * 10.0 ** e for e in range(-5, 1) for m in (1, 2, 5))  # 10 µs .. 5 s
+    DEPTH_EDGES = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.units = {}
+            self.started = time.monotonic()
+    
+    def _add(self, name, value, unit, edges):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(edges)
+                self.units[name] = unit
+            histogram.add(value)
+    
+    def add_time(self, name, seconds):
+        self._add(name, seconds, "s", self.TIME_EDGES)
+    
+    def add_depth(self, name, samples):
+        self._add(name, samples, "samples", self.DEPTH_EDGES)
+    
+    def summary(self):
+        """One line per stage, for the status panel."""
+        lines = []
+        with self.lock:
+            for name, h in self.histograms.items():
+                if self.units[name] == "s":
+                    values = " ".join(f"{label} {h.percentile(p) * 1000:7.2f}" for label, p in
+                                      (("p50", 50), ("p95", 95), ("p99", 99))) + f" max {h.max * 1000:7.2f} ms"
+                else:
+                    values = " ".join(f"{label} {h.percentile(p):7g}" for label, p in
+                                      (("p50", 50), ("p95", 95), ("p99", 99))) + f" max {h.max:7g}"
+                lines.append(f"{name:<14} {h.count:8d}x  {values}")
+        return "\n".join(lines)
+    
+    def as_dict(self):
+        with self.lock:
+            return {"seconds": time.monotonic() - self.started,
+                    "stages": {name: dict(h.as_dict(), unit=self.units[name])
+                               for name, h in self.histograms.items()}}
+    
+    def save(self, path):
+        try:
+            with open(path, 'w') as f:
+                json.dump(self.as_dict(), f, indent=1)
+            print(f"Performance metrics written to {path}")
+        except OSError as e:
+            print(f"Error while writing performance metrics: {e}")
+
+
+METRICS = Metrics()
+
+
+def event_log_path(out_path, kind="events"):
+    """
+    Where test sequence transitions ("events") or DCIR results ("dcir") are
+    logged: next to the output.
+    """
+    if out_path:
+        return os.path.splitext(out_path)[0] + f" {kind}.csv"
+    return None
+
+
+def metrics_path(out_path, perf_path=None):
+    """Where the metrics of a run go: --perf-json, else next to the output."""
+    if perf_path:
+        return perf_path
+    if out_path:
+        return os.path.splitext(out_path)[0] + ".perf.json"
+    return None
+
+
+def open_csv(path, append, header=CSV_HEADER):
+    """
+    Open the output CSV and write the header row, unless appending to a log
+    that already has one (check_csv_header() tells if it is the same).
+    """
+    if append and os.path.exists(path) and os.path.getsize(path) > 0:
+        # Drop a torn last line left by a crash so the next row starts clean
+        with open(path, 'r+b') as f:
+            end = f.seek(0, os.SEEK_END)
+            f.seek(max(end - 4096, 0))
+            tail = f.read()
+            if not tail.endswith(b"\n"):
+                f.truncate(end - len(tail) + tail.rfind(b"\n") + 1 if b"\n" in tail else end)
+        csvfile = open(path, 'a', newline='')
+        return csvfile, csv.writer(csvfile)
+    csvfile = open(path, 'w', newline='')
+    wr = csv.writer(csvfile)
+    wr.writerow(header)
+    return csvfile, wr
+
+
+def check_csv_header(path, header=CSV_HEADER):
+    """Raises ValueError if an existing, non-empty CSV has another header."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, newline='') as f:
+        found = next(csv.reader([f.readline()]), [])
+    if found != list(header):
+        raise ValueError(f"{path} has the columns {found}, expected {list(header)}")
+
+
+class CsvLog:
+    """
+    Background CSV writer that several devices may feed from their own
+    threads. add() only queues the snapshot; row formatting and disk I/O
+    happen on the log's writer thread in batches, so acquisition never
+    waits for the disk. With with_port=True a 'port' column is appended so
+    one combined log can hold all devices.
+    
+    Durability policy: the file is flushed every flush_rows rows or every
+    flush_seconds seconds, whichever comes first, and flushed + fsync'ed on
+    sync() (important events) and when the last attached device detaches.
+    
+    A disk error (OSError), or a file that can't be appended to after all
+    (ValueError), closes the log: it is reported once, on the
+    console and through on_error(exception) (called on the writer thread),
+    and add() drops everything from then on.
+    """
+    _SYNC = object()
+    _CLOSE = object()
+    
+    def __init__(self, path, append, with_port=False, flush_rows=20, flush_seconds=1.0):
+        self.path = path
+        self.append = append
+        self.with_port = with_port
+        self.flush_rows = max(int(flush_rows), 1)
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self.users = 0
+        self.closed = False
+        self.error = None
+        self.on_error = None
+        self.file = None
+        self.wr = None
+        self.queue = queue.SimpleQueue()
+        
+        # Statistics for report()
+        self.rows = 0
+        self.flushes = 0
+        self.fsyncs = 0
+        self.write_time = 0.0
+        self.max_backlog = 0
+        
+        self.thread = threading.Thread(target=self._run, name=f"CSV {os.path.basename(path)}", daemon=True)
+        self.thread.start()
+    
+    def attach(self):
+        with self.lock:
+            self.users += 1
+    
+    def detach(self):
+        with self.lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+        self.close()
+    
+    def close(self):
+        """Finish the log: what is queued is still written. See also detach()."""
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                self.queue.put(self._CLOSE)
+    
+    def add(self, snap, port):
+        if not self.closed:
+            self.queue.put((snap, port))
+    
+    def sync(self):
+        """Flush and fsync everything queued so far, e.g. after a state change."""
+        if not self.closed:
+            self.queue.put(self._SYNC)
+    
+    @property
+    def backlog(self):
+        return self.queue.qsize()
+    
+    def join(self, timeout=None):
+        self.thread.join(timeout)
+    
+    def _run(self):
+        pending = 0
+        last_flush = time.monotonic()
+        while True:
+            timeout = None
+            if pending:
+                timeout = max(self.flush_seconds - (time.monotonic() - last_flush), 0)
+            try:
+                items = [self.queue.get(timeout=timeout)]
+            except queue.Empty:
+                items = []
+            # Take whatever else is waiting as one batch
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.max_backlog = max(self.max_backlog, len(items))
+            METRICS.add_depth("csv backlog", len(items))
+            
+            t0 = time.perf_counter()
+            rows = []
+            sync = close = False
+            for item in items:
+                if item is self._SYNC:
+                    sync = True
+                elif item is self._CLOSE:
+                    close = True
+                else:
+                    rows.append(self._encode(*item))
+            try:
+                if rows:
+                    if self.file is None:
+                        self._open()
+                    self._write(rows)
+                    self.rows += len(rows)
+                    pending += len(rows)
+                if self.file and (sync or close or pending >= self.flush_rows
+                                  or (pending and time.monotonic() - last_flush >= self.flush_seconds)):
+                    self.file.flush()
+                    self.flushes += 1
+                    if sync or close:
+                        os.fsync(self.file.fileno())
+                        self.fsyncs += 1
+                    pending = 0
+                    last_flush = time.monotonic()
+            except (OSError, ValueError) as e:
+                self._fail(e)
+                return
+            elapsed = time.perf_counter() - t0
+            self.write_time += elapsed
+            METRICS.add_time("csv write", elapsed)
+            if close:
+                if self.file:
+                    self.file.close()
+                    self.file = None
+                    self.wr = None
+                print(self.report())
+                return
+    
+    def _fail(self, e):
+        # Stop logging for good; the acquisition carries on without the log
+        with self.lock:
+            self.closed = True
+        self.error = e
+        if self.file:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+            self.wr = None
+        # Let go of what is still queued
+        dropped = 0
+        while True:
+            try:
+                self.queue.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                break
+        print(f"Error while writing {self.path}, logging stopped ({dropped} queued row(s) dropped): {e}")
+        if self.on_error:
+            self.on_error(e)
+    
+    def _open(self):
+        header = CSV_HEADER + ['port'] if self.with_port else CSV_HEADER
+        self.file, self.wr = open_csv(self.path, self.append, header)
+    
+    def _encode(self, snap, port):
+        row = csv_row(snap)
+        if self.with_port:
+            row.append(port)
+        return row
+    
+    def _write(self, rows):
+        self.wr.writerows(rows)
+    
+    def report(self):
+        rate = self.rows / self.write_time if self.write_time else 0.0
+        return (f"{type(self).__name__} {self.path}: {self.rows} rows, {rate:.0f} rows/s while writing, "
+                f"{self.flushes} flushes, {self.fsyncs} fsyncs, backlog {self.backlog} (max {self.max_backlog})")
+
+
+# Binary log: BIN_MAGIC, uint32 header length, JSON schema header, then
+# fixed-width records of BIN_RECORD (little endian)
+BIN_MAGIC = b"DL24LOG1"
+BIN_RECORD = struct.Struct("<d5fIH")
+BIN_FIELDS = ['date', 'voltage', 'current', 'device_energy', 'device_charge', 'temp', 'time_seconds', 'port']
+BIN_NO_PORT = 0xFFFF
+
+
+def write_binlog_header(f, ports):
+    header = json.dumps({"version": 1, "record": BIN_RECORD.format, "fields": BIN_FIELDS,
+                         "ports": ports}).encode()
+    f.write(BIN_MAGIC + struct.pack("<I", len(header)) + header)
+
+
+def read_binlog_header(f):
+    """Returns the schema dict and the file offset of the first record."""
+    if f.read(len(BIN_MAGIC)) != BIN_MAGIC:
+        raise ValueError(f"{f.name} is not a DL24 binary log")
+    data = f.read(4)
+    if len(data) < 4:
+        raise ValueError(f"{f.name}: truncated header")
+    (length,) = struct.unpack("<I", data)
+    schema = json.loads(f.read(length))
+    if not isinstance(schema, dict):
+        raise ValueError(f"{f.name}: invalid header")
+    if schema.get("record") != BIN_RECORD.format:
+        raise ValueError(f"{f.name}: unsupported record layout {schema.get('record')!r}")
+    return schema, len(BIN_MAGIC) + 4 + length
+
+
+def check_binlog_header(path, ports):
+    """
+    Raises ValueError if an existing, non-empty file is not a binary log or
+    was written for other ports (None: a log of one device).
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb') as f:
+        schema, offset = read_binlog_header(f)
+    if schema.get("ports") != ports:
+        raise ValueError(f"{path} was written for ports {schema.get('ports')}, not {ports}")
+
+
+def open_binlog(path, append, ports):
+    if append and os.path.exists(path) and os.path.getsize(path) > 0:
+        f = open(path, 'r+b')
+        try:
+            schema, offset = read_binlog_header(f)
+        except ValueError:
+            f.close()
+            raise
+        if schema.get("ports") != ports:
+            f.close()
+            raise ValueError(f"{path} was written for ports {schema.get('ports')}, not {ports}")
+        # Drop a torn record left by a crash so new records stay aligned
+        size = os.path.getsize(path)
+        end = offset + (size - offset) // BIN_RECORD.size * BIN_RECORD.size
+        f.truncate(end)
+        f.seek(end)
+        return f
+    f = open(path, 'wb')
+    write_binlog_header(f, ports)
+    return f
+
+
+def iter_binlog(path, chunk_records=65536):
+    """
+    Yields (schema, records) per chunk, records being BIN_RECORD tuples.
+    A torn final record (crash while writing) is ignored.
+    """
+    with open(path, 'rb') as f:
+        schema, offset = read_binlog_header(f)
+        while True:
+            data = f.read(chunk_records * BIN_RECORD.size)
+            whole = len(data) // BIN_RECORD.size * BIN_RECORD.size
+            if whole:
+                yield schema, BIN_RECORD.iter_unpack(data[:whole])
+            if len(data) < chunk_records * BIN_RECORD.size:
+                break
+
+
+def binlog_to_csv(src, dst):
+    """Stream a binary log back into the CSV layout written by CsvLog."""
+    rows = 0
+    with open(dst, 'w', newline='') as csvfile:
+        wr = csv.writer(csvfile)
+        header_written = False
+        for schema, records in iter_binlog(src):
+            ports = schema.get("ports")
+            if not header_written:
+                wr.writerow(CSV_HEADER + ['port'] if ports else CSV_HEADER)
+                header_written = True
+            for ts, voltage, current, energy, charge, temp, seconds, port in records:
+                snap = Snapshot(datetime.datetime.fromtimestamp(ts), None, voltage, current, temp,
+                                energy, charge, datetime.timedelta(seconds=seconds))
+                row = csv_row(snap)
+                if ports:
+                    row.append(ports[port] if port < len(ports) else "")
+                wr.writerow(row)
+                rows += 1
+    return rows
+
+
+def _csv_record(row):
+    return Snapshot(datetime.datetime.fromisoformat(row[0]), None, float(row[1]), float(row[2]),
+                    float(row[6]), float(row[4]), float(row[5]), datetime.timedelta(seconds=int(row[7])))
+
+
+def read_log_tail(path, count, port=None):
+    """
+    The last `count` records of a CSV or binary log as Snapshots (mono is
+    None), oldest first; with `port`, only that port's records of a combined
+    log. Only the end of the file is read, in blocks growing backwards from
+    the end, so this takes milliseconds however long the log is. A torn last
+    record is skipped. Raises ValueError if the file is not one of our logs,
+    or `port` is given but the log has no such port (column).
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(BIN_MAGIC)) == BIN_MAGIC:
+            f.seek(0)
+            schema, offset = read_binlog_header(f)
+            ports = schema.get("ports") or []
+            if port is not None and port not in ports:
+                raise ValueError(f"{path} has no records of {port} (ports {ports})")
+            index = None if port is None else ports.index(port)
+            end = offset + (f.seek(0, os.SEEK_END) - offset) // BIN_RECORD.size * BIN_RECORD.size
+            size = count
+            while True:
+                start = max(end - size * BIN_RECORD.size, offset)
+                f.seek(start)
+                records = [r for r in BIN_RECORD.iter_unpack(f.read(end - start))
+                           if index is None or r[7] == index]
+                if len(records) >= count or start == offset:
+                    break
+                size *= 4
+            return [Snapshot(datetime.datetime.fromtimestamp(ts), None, voltage, current, temp, energy, charge,
+                             datetime.timedelta(seconds=seconds))
+                    for ts, voltage, current, energy, charge, temp, seconds, _ in records[-count:]]
+        
+        f.seek(0)
+        header_line = f.readline()
+        header = next(csv.reader([header_line.decode()]), [])
+        if header not in (CSV_HEADER, CSV_HEADER + ['port']):
+            raise ValueError(f"{path} is not a DL24 log (columns {header})")
+        with_port = len(header) > len(CSV_HEADER)
+        if port is not None and not with_port:
+            raise ValueError(f"{path} has no port column")
+        first = len(header_line)
+        end = f.seek(0, os.SEEK_END)
+        size = max(count * 96, 4096)  # about a row each
+        while True:
+            start = max(end - size, first)
+            f.seek(start)
+            lines = f.read(end - start).split(b"\n")
+            # The last piece is empty, or a torn line; the first may be cut off
+            lines.pop()
+            if start > first:
+                lines = lines[1:]
+            # Appending to a log of another run repeats the header
+            rows = [row for row in csv.reader(line.decode() for line in lines if line.strip())
+                    if row[0] != 'date' and (port is None or row[-1] == port)]
+            if len(rows) >= count or start == first:
+                break
+            size *= 4
+        return [_csv_record(row) for row in rows[-count:]]
+
+
+def binlog_dtype():
+    """numpy dtype of one BIN_RECORD, for memory-mapping a binary log."""
+    return np.dtype([('t', '<f8'), ('voltage', '<f4'), ('current', '<f4'), ('energy', '<f4'),
+                     ('charge', '<f4'), ('temp', '<f4'), ('seconds', '<u4'), ('port', '<u2')])
+
+
+class BinaryLog(CsvLog):
+    """
+    Same writer stage and flush policy as CsvLog, but appends fixed-width
+    binary records (float64 epoch timestamp, float32 channels) instead of
+    formatted text. Export with binlog_to_csv().
+    """
+    def __init__(self, path, append, with_port=False, ports=(), **policy):
+        self.ports = list(ports) if with_port else None
+        super().__init__(path, append, with_port, **policy)
+    
+    def _open(self):
+        self.file = open_binlog(self.path, self.append, self.ports)
+    
+    def _encode(self, snap, port):
+        index = self.ports.index(port) if self.ports and port in self.ports else BIN_NO_PORT
+        return BIN_RECORD.pack(snap.t.timestamp(), snap.voltage, snap.current, snap.energy,
+                               snap.charge, snap.temp, int(snap.on_time.total_seconds()), index)
+    
+    def _write(self, rows):
+        self.file.write(b"".join(rows))
+
+
+class DeadlineScheduler:
+    """
+    Fixed-rate sampling on absolute time.monotonic() deadlines. Time spent
+    reading or waiting for the port does not stretch the period; a cycle that
+    is late by more than a whole period is counted as missed and skipped
+    instead of being made up with a burst of catch-up samples.
+    """
+    MIN_PERIOD = 0.1
+    
+    def __init__(self, period=0.5):
+        self.period = max(float(period), self.MIN_PERIOD)
+        self.reset()
+    
+    def reset(self, start=None):
+        """
+        Start a new run. The first deadline is start (a time.monotonic()
+        value, shared by devices sampled in step) or right away.
+        """
+        self.next_deadline = start
+        self.started = self.last = None
+        self.cycles = self.missed = 0
+        self.jitter_sum = self.jitter_max = 0.0
+    
+    def set_period(self, period):
+        period = max(float(period), self.MIN_PERIOD)
+        if self.next_deadline is not None:
+            # Re-anchor on the previous deadline so the change applies right away;
+            # a deadline that is then already over is due now, not missed
+            self.next_deadline = max(self.next_deadline + period - self.period, time.monotonic())
+        self.period = period
+    
+    def time_to_deadline(self):
+        if self.next_deadline is None:
+            return 0.0
+        return self.next_deadline - time.monotonic()
+    
+    def tick(self):
+        """Account for the deadline that has just been reached and advance."""
+        now = time.monotonic()
+        if self.next_deadline is None:
+            self.next_deadline = now
+        if self.started is None:
+            self.started = now
+        late = now - self.next_deadline
+        if late >= self.period:
+            skipped = int(late // self.period)
+            self.missed += skipped
+            self.next_deadline += skipped * self.period
+            late -= skipped * self.period
+        self.jitter_sum += late
+        self.jitter_max = max(self.jitter_max, late)
+        self.next_deadline += self.period
+        self.cycles += 1
+        self.last = now
+    
+    @property
+    def achieved_rate(self):
+        if self.cycles < 2:
+            return 0.0
+        return (self.cycles - 1) / (self.last - self.started)
+    
+    def report(self):
+        mean_jitter = self.jitter_sum / self.cycles if self.cycles else 0.0
+        return (f"Rate: {self.achieved_rate:.3f} Hz (target {1 / self.period:.3f} Hz) | "
+                f"jitter {mean_jitter * 1000:.1f} ms mean, {self.jitter_max * 1000:.1f} ms max | "
+                f"missed {self.missed}")
+
+
+class DL24Session:
+    """
+    Owns one open DL24 handle for the whole session instead of opening,
+    configuring and closing the serial port for every sample and command.
+    Any failing call drops the handle (the reply stream may be out of sync),
+    the next call reconnects. Reconnects back off exponentially up to
+    backoff_max seconds so a missing device does not hammer the port.
+    """
+    def __init__(self, port, backoff_initial=0.5, backoff_max=30.0):
+        self.port = port
+        self.lock = threading.RLock()
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._backoff = backoff_initial
+        self._next_attempt = 0.0
+        self._connect_error = None  # message of the last failed connect, repeated while backing off
+        self._cm = None
+        self._dl24 = None
+        
+        # Statistics for report()
+        self.calls = 0
+        self.failures = 0
+        self.open_count = 0
+        self.open_time = 0.0
+        self.close_count = 0
+        self.close_time = 0.0
+    
+    @property
+    def connected(self):
+        return self._dl24 is not None
+    
+    def _connect(self):
+        now = time.monotonic()
+        if now < self._next_attempt:
+            # Same text as the failure itself, so callers can report a dead link once
+            raise ConnectionError(self._connect_error)
+        t0 = time.perf_counter()
+        try:
+            cm = DL24(self.port)
+            dl24 = cm.__enter__()
+        except Exception as e:
+            self._next_attempt = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, self.backoff_max)
+            self._connect_error = str(e) or f"{self.port} unavailable"
+            raise
+        self.open_time += time.perf_counter() - t0
+        self.open_count += 1
+        self._backoff = self.backoff_initial
+        self._cm, self._dl24 = cm, dl24
+        if self.open_count > 1:
+            print(f"Reconnected to DL24 on {self.port}")
+        return dl24
+    
+    def _drop(self):
+        cm = self._cm
+        self._cm = self._dl24 = None
+        if cm is None:
+            return
+        t0 = time.perf_counter()
+        try:
+            cm.__exit__(None, None, None)
+        except Exception:
+            pass
+        self.close_time += time.perf_counter() - t0
+        self.close_count += 1
+    
+    def call(self, operation):
+        """Run operation(dl24) on the persistent handle, reconnecting if needed."""
+        with self.lock:
+            dl24 = self._dl24 if self._dl24 is not None else self._connect()
+            t0 = time.perf_counter()
+            try:
+                result = operation(dl24)
+            except Exception:
+                self.failures += 1
+                self._drop()
+                raise
+            METRICS.add_time("serial", time.perf_counter() - t0)
+            self.calls += 1
+            return result
+    
+    def close(self):
+        with self.lock:
+            self._drop()
+    
+    def report(self):
+        """
+        Time saved compared to opening and closing the port for every call,
+        based on the measured open/close cost of this session.
+        """
+        if self.open_count == 0:
+            return f"{self.port}: no connection made"
+        cycle_cost = self.open_time / self.open_count
+        if self.close_count:
+            cycle_cost += self.close_time / self.close_count
+        saved = cycle_cost * max(self.calls - self.open_count, 0)
+        per_call = saved / self.calls if self.calls else 0.0
+        return (f"{self.port}: {self.calls} calls over {self.open_count} connection(s), "
+                f"{self.failures} failure(s); open+close {cycle_cost * 1000:.1f} ms, "
+                f"saved {per_call * 1000:.1f} ms per cycle ({saved:.1f} s total)")
+
+
+class DL24Worker:
+    """
+    Single I/O thread that owns the DL24 session. Everything that talks to
+    the device is submitted here as a command and gets a
+    concurrent.futures.Future back, so the caller never blocks on the port.
+    Commands run in priority order between sampling deadlines: safety
+    commands (disable, reset) and user commands go ahead of a due sample,
+    routine work (settings refresh, reads) waits behind it.
+    """
+    PRIORITY_SAFETY = 0
+    PRIORITY_COMMAND = 1
+    PRIORITY_ROUTINE = 2
+    
+    def __init__(self, session, scheduler):
+        self.session = session
+        self.scheduler = scheduler
+        self.sampling = False
+        self.on_sample = None
+        self.on_error = None
+        self.running = True
+        self._heap = []
+        self._timed = []  # (deadline, seq, priority, operation, future), see submit_at()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._in_sample = False
+        self._on_stopped = None
+        self._last_error = None
+        self.thread = threading.Thread(target=self._run, name=f"DL24 {session.port}", daemon=True)
+        self.thread.start()
+    
+    def submit(self, operation, priority=PRIORITY_COMMAND):
+        """Queue operation(dl24) for the worker thread; returns a Future."""
+        future = Future()
+        with self._cond:
+            if not self.running:
+                future.set_exception(RuntimeError("DL24 worker stopped"))
+                return future
+            heapq.heappush(self._heap, (priority, next(self._seq), operation, future))
+            self._cond.notify()
+        return future
+    
+    def submit_at(self, deadline, operation, priority=PRIORITY_COMMAND):
+        """
+        Like submit(), but the command is not run before time.monotonic()
+        reaches deadline. Cancel the Future to take it back.
+        """
+        future = Future()
+        with self._cond:
+            if not self.running:
+                future.set_exception(RuntimeError("DL24 worker stopped"))
+                return future
+            heapq.heappush(self._timed, (deadline, next(self._seq), priority, operation, future))
+            self._cond.notify()
+        return future
+    
+    def set_period(self, period):
+        """Change the sampling period; a waiting worker picks it up right away."""
+        with self._cond:
+            self.scheduler.set_period(period)
+            self._cond.notify()
+    
+    def start_sampling(self, on_sample, on_error=None):
+        """Call on_sample(snapshot) on the worker thread at every scheduler deadline."""
+        with self._cond:
+            self.on_sample = on_sample
+            self.on_error = on_error
+            self._last_error = None
+            self.sampling = True
+            self._cond.notify()
+    
+    def stop_sampling(self, on_stopped=None):
+        """
+        Stop sampling without waiting. on_stopped() runs once no sample is in
+        progress any more: right away, or on the worker thread after the
+        sample currently being handled.
+        """
+        with self._cond:
+            self.sampling = False
+            if self._in_sample:
+                self._on_stopped = on_stopped
+                return
+        if on_stopped:
+            on_stopped()
+    
+    def stop(self, timeout=5.0):
+        """Run the commands already queued, then end the thread."""
+        with self._cond:
+            self.sampling = False
+            self.running = False
+            self._cond.notify()
+        self.thread.join(timeout)
+    
+    def _next_job(self):
+        # Returns a queued command, None for "take a sample" or False to exit
+        with self._cond:
+            while True:
+                # Timed commands join the queue once their deadline is reached
+                now = time.monotonic()
+                while self._timed and self._timed[0][0] <= now:
+                    deadline, seq, priority, operation, future = heapq.heappop(self._timed)
+                    heapq.heappush(self._heap, (priority, seq, operation, future))
+                due = self.sampling and self.scheduler.time_to_deadline() <= 0
+                if self._heap and (not due or self._heap[0][0] < self.PRIORITY_ROUTINE):
+                    return heapq.heappop(self._heap)
+                if due:
+                    self._in_sample = True
+                    return None
+                if not self.running:
+                    for timed in self._timed:
+                        timed[4].cancel()
+                    self._timed = []
+                    return False
+                timeouts = [self.scheduler.time_to_deadline()] if self.sampling else []
+                if self._timed:
+                    timeouts.append(self._timed[0][0] - now)
+                self._cond.wait(min(timeouts) if timeouts else None)
+    
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is False:
+                break
+            if job is None:
+                try:
+                    self.scheduler.tick()
+                    self._sample()
+                finally:
+                    with self._cond:
+                        self._in_sample = False
+                        on_stopped, self._on_stopped = self._on_stopped, None
+                    if on_stopped:
+                        on_stopped()
+                continue
+            priority, _, operation, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.session.call(operation))
+            except Exception as e:
+                future.set_exception(e)
+    
+    def _sample(self):
+        try:
+            snap = self.session.call(read_snapshot)
+        except Exception as e:
+            # Report a dead link once, not at every deadline until it recovers
+            message = str(e) or type(e).__name__
+            if message != self._last_error and self.on_error:
+                self.on_error(e)
+            self._last_error = message
+            return
+        if self._last_error is not None:
+            print(f"DL24 on {self.session.port} responding again")
+            self._last_error = None
+        try:
+            self.on_sample(snap)
+        except Exception as e:
+            print(f"Error while handling sample: {e}")
+
+
+class EventLog:
+    """
+    CSV of the transitions of test sequences, written next to the sample
+    log ("<output> events.csv"). Rows come rarely, from the device
+    threads, so they are written and flushed right away.
+    """
+    HEADER = ['date', 'port', 'step', 'event', 'target_current', 'planned_s', 'late_ms', 'command_ms',
+              'effect_ms', 'detail']
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+        self.wr = None
+    
+    def add(self, port, event):
+        with self.lock:
+            if self.file is None:
+                self.file, self.wr = open_csv(self.path, True, self.HEADER)
+            self.wr.writerow(self._row(port, event))
+            self.file.flush()
+    
+    def _row(self, port, event):
+        return [event['t'].strftime("%Y-%m-%d %H:%M:%S.%f")[:-3], port, event['step'], event['event'],
+                _fmt(event.get('target'), "{:.3f}"), _fmt(event.get('planned'), "{:.3f}"),
+                _fmt(event.get('late'), "{:.1f}"), _fmt(event.get('command'), "{:.1f}"),
+                _fmt(event.get('effect'), "{:.1f}"), event.get('detail', "")]
+    
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+def _fmt(value, spec):
+    return "" if value is None else spec.format(value)
+
+
+class TestSequence:
+    """
+    Runs a load profile on a device's worker thread. Every transition is a
+    worker command scheduled with submit_at() on a monotonic deadline that
+    is the sum of the planned step durations, so time spent executing
+    commands does not accumulate into drift.
+    
+    Profile (JSON file):
+    {"cutoff": 3.0,                                   voltage cutoff, set first
+     "steps": [
+        {"current": 1.0, "duration": 600},            constant current
+        {"rest": 60},                                 load off
+        {"pulse": {"high": 2.0, "low": 0.5, "on": 10, "off": 30, "count": 20}},
+        {"loop": [...], "count": 5},                  repeat the steps 5 times
+        {"loop": [...], "until": "cutoff"}]}          repeat until the load cuts off
+    A pulse with "low": 0 rests between pulses; without "count" it repeats
+    until cutoff.
+    
+    Each transition reports how late it ran against its deadline and how
+    long the commands took; samples passed to on_sample() then give the
+    command-to-effect latency (until the measured current is within
+    tolerance of the target) and reveal the load switching itself off at
+    the cutoff. A cutoff ends the innermost "until cutoff" loop (so does a
+    pulse) before its next step, so the load is not
+    switched on again inside it; the profile continues after the loop. A
+    cutoff outside of such a loop ends the profile: the cell is empty.
+    """
+    EFFECT_TIMEOUT = 5.0  # s to wait for the current to reach a new target
+    
+    def __init__(self, worker, profile, on_event=None, tolerance=0.05):
+        self.worker = worker
+        self.profile = profile
+        self.on_event = on_event
+        self.tolerance = tolerance
+        self.lock = threading.RLock()
+        self.running = False
+        self.cutoff_reached = False
+        self.target = 0.0
+        self._steps = None
+        self._step = None
+        self._first = True
+        self._deadline = None
+        self._start = None
+        self._next = None
+        self._effect = None  # (target, command time, step) still waiting to show in the samples
+        self._from_off = True  # the current step switched the load on
+        self.late = []
+        self.command = []
+        self.effect = []
+    
+    @staticmethod
+    def load(path):
+        """Read and check a profile file; raises ValueError (or OSError)."""
+        with open(path) as f:
+            try:
+                profile = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}: {e}")
+        if not isinstance(profile, dict):
+            raise ValueError(f"{path}: a profile must be an object with 'steps'")
+        TestSequence._check(profile.get("steps"), path)
+        return profile
+    
+    @staticmethod
+    def _check(steps, where):
+        if not isinstance(steps, list) or not steps or not all(isinstance(step, dict) for step in steps):
+            raise ValueError(f"{where}: 'steps' must be a non-empty list of objects")
+        for step in steps:
+            if "loop" in step:
+                if step.get("count") is None and step.get("until") != "cutoff":
+                    raise ValueError(f"{where}: a loop needs a 'count' or 'until': 'cutoff'")
+                TestSequence._check(step["loop"], where)
+            elif "pulse" in step:
+                if not isinstance(step["pulse"], dict) or not {"high", "on", "off"} <= set(step["pulse"]):
+                    raise ValueError(f"{where}: a pulse needs 'high', 'on' and 'off'")
+            elif not ("rest" in step or {"current", "duration"} <= set(step)):
+                raise ValueError(f"{where}: unknown step {step}")
+    
+    def _expand(self, steps):
+        # Yields the plain steps, repeating loops (as long as needed). Checked
+        # before every step: after a cutoff nothing more is yielded until the
+        # innermost "until cutoff" loop has ended and cleared the flag.
+        for step in steps:
+            if self.cutoff_reached:
+                return
+            if "pulse" in step:
+                pulse = step["pulse"]
+                low = pulse.get("low", 0)
+                step = {"loop": [{"current": pulse["high"], "duration": pulse["on"]},
+                                 {"current": low, "duration": pulse["off"]} if low else {"rest": pulse["off"]}],
+                        "count": pulse.get("count"), "until": "cutoff"}
+            if "loop" in step:
+                for _ in itertools.count() if step.get("count") is None else range(step["count"]):
+                    if self.cutoff_reached:
+                        break
+                    yield from self._expand(step["loop"])
+                if step.get("until") == "cutoff":
+                    self.cutoff_reached = False
+                continue
+            yield step
+    
+    def start(self, start=None):
+        with self.lock:
+            self.running = True
+            self._steps = self._expand(self.profile["steps"])
+            self._first = True
+            self._start = self._deadline = start or time.monotonic()
+            self._schedule()
+    
+    def stop(self):
+        """Abandon the profile and switch the load off."""
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+            if self._next is not None:
+                self._next.cancel()
+        self.worker.submit(lambda dl24: dl24.disable(), DL24Worker.PRIORITY_SAFETY)
+        self._event("stopped", "-")
+    
+    def _schedule(self):
+        self._next = self.worker.submit_at(self._deadline, self._transition)
+        self._next.add_done_callback(self._after)
+    
+    def _transition(self, dl24):
+        # On the worker thread, inside the session's call()
+        with self.lock:
+            late = time.monotonic() - self._deadline
+            if self._first and "cutoff" in self.profile:
+                dl24.set_voltage_cutoff(self.profile["cutoff"])
+            self._first = False
+            step = self._step = next(self._steps, None)
+            t0 = time.monotonic()
+            if step is None:
+                dl24.disable()
+                self.running = False
+                self.target = 0.0
+                return None, late, time.monotonic() - t0, t0
+            if "rest" in step:
+                dl24.disable()
+                self.target = 0.0
+            else:
+                dl24.set_current(step["current"])
+                self._from_off = self.target == 0.0
+                if self._from_off:
+                    dl24.enable()
+                self.target = step["current"]
+            return step, late, time.monotonic() - t0, t0
+    
+    def _after(self, future):
+        if future.cancelled():
+            return
+        with self.lock:
+            error = future.exception()
+            if error is not None and not self.worker.running:
+                # The device is being closed; nothing more can be scheduled
+                self.running = False
+                self._event("error", "-", detail=str(error))
+                return
+            if error is not None:
+                # The profile keeps its timing; the step's command is lost
+                step = self._step
+                self._event("error", describe_step(step) if step else "-", detail=str(error))
+                if step is None:
+                    self.running = False
+                    return
+                duration = step.get("duration", step.get("rest"))
+            else:
+                step, late, command, t0 = future.result()
+                if step is None:
+                    self._event("done", "-", late=late * 1000, command=command * 1000)
+                    print(f"{self.worker.session.port}: {self.report()}")
+                    return
+                duration = step.get("duration", step.get("rest"))
+                self.late.append(late)
+                self.command.append(command)
+                self._effect = (self.target, t0, describe_step(step))
+                self._event("step", describe_step(step), target=self.target,
+                            planned=self._deadline - self._start, late=late * 1000, command=command * 1000)
+            if self.running:
+                self._deadline += duration
+                self._schedule()
+    
+    def on_sample(self, snap):
+        """Feed every sample while the sequence runs (any thread)."""
+        with self.lock:
+            if not self.running or snap.mono is None:
+                return
+            if self._effect is not None:
+                target, t0, step = self._effect
+                if snap.mono < t0:
+                    return
+                if abs(snap.current - target) <= self.tolerance * target + 0.02:
+                    self._effect = None
+                    self.effect.append(snap.mono - t0)
+                    self._event("effect", step, target=target, effect=(snap.mono - t0) * 1000)
+                    return
+                if snap.mono - t0 < self.EFFECT_TIMEOUT:
+                    if self._from_off or snap.current >= 0.1 * target:
+                        return
+                    # The load was on already: no current is not the step's ramp but a cutoff
+                    self._effect = None
+                else:
+                    self._effect = None
+                    self._event("no effect", step, target=target,
+                                detail=f"{snap.current:.3f} A after {snap.mono - t0:.1f} s")
+            if self.target > 0 and snap.current < 0.1 * self.target:
+                # The load switched itself off: voltage cutoff (or its timer)
+                self.cutoff_reached = True
+                self.target = 0.0
+                self._event("cutoff", "-", detail=f"{snap.voltage:.3f} V")
+                if self._next is not None and self._next.cancel():
+                    self._deadline = time.monotonic()
+                    self._schedule()
+    
+    def _event(self, event, step, **values):
+        values.update(t=datetime.datetime.now(), event=event, step=step)
+        if self.on_event:
+            self.on_event(values)
+    
+    def report(self):
+        def ms(values, p):
+            return sorted(values)[min(int(p / 100 * len(values)), len(values) - 1)] * 1000 if values else 0.0
+        return (f"profile: {len(self.late)} step(s), late p50 {ms(self.late, 50):.1f} ms max {ms(self.late, 100):.1f} ms, "
+                f"commands p50 {ms(self.command, 50):.1f} ms, command-to-effect p50 {ms(self.effect, 50):.0f} ms "
+                f"max {ms(self.effect, 100):.0f} ms ({len(self.effect)} measured, resolution one sample period)")
+
+
+def describe_step(step):
+    if "rest" in step:
+        return f"rest {step['rest']:g} s"
+    return f"CC {step['current']:g} A {step['duration']:g} s"
+
+
+class DCIRLog(EventLog):
+    """One row per DCIR pulse ("<output> dcir.csv")."""
+    HEADER = ['date', 'port', 'pulse', 'low_current', 'high_current', 'v_before', 'i_before', 'v_after', 'i_after',
+              'resistance_mohm', 'samples_before', 'samples_after', 'rate_hz', 'detail']
+    
+    def _row(self, port, result):
+        r = result.get('resistance')
+        return [result['t'].strftime("%Y-%m-%d %H:%M:%S.%f")[:-3], port, result['pulse'],
+                f"{result['low']:.3f}", f"{result['high']:.3f}", _fmt(result.get('v_before'), "{:.4f}"),
+                _fmt(result.get('i_before'), "{:.4f}"), _fmt(result.get('v_after'), "{:.4f}"),
+                _fmt(result.get('i_after'), "{:.4f}"), _fmt(None if r is None else r * 1000, "{:.2f}"),
+                result.get('samples_before', ""), result.get('samples_after', ""),
+                _fmt(result.get('rate'), "{:.0f}"), result.get('detail', "")]
+
+
+class DCIRTest:
+    """
+    DC internal resistance from current steps, run on a device's worker
+    thread. A pulse is a single worker command, so nothing else talks to
+    the device while it runs: voltage and current are read as fast as the
+    link allows (read_vi) for `window` seconds at the base current, the
+    current steps to `high` through set_current, they are read for another
+    `window` seconds, and the current goes back to `low` (0 = load off).
+    
+    R = -(V_after - V_before) / (I_after - I_before), with the means of the
+    window before the step and of the samples from `settle` seconds after
+    it. Regular sampling pauses during a pulse (the scheduler counts the
+    missed deadlines). Pulses start every `interval` seconds on monotonic
+    deadlines, `count` times or, without a count, until the load no longer
+    follows the step (voltage cutoff).
+    """
+    MAX_RATE = 1000   # V/I pairs per second the buffers are sized for
+    MIN_STEP = 0.01   # A, smaller current steps give no result
+    
+    def __init__(self, worker, high, low=0.0, window=1.0, settle=0.1, interval=60.0, count=None, on_result=None):
+        self.worker = worker
+        self.high = high
+        self.low = low
+        self.window = window
+        self.settle = settle
+        self.interval = max(interval, 2 * window)
+        self.count = count
+        self.on_result = on_result
+        self.lock = threading.Lock()
+        self.running = False
+        self.pulses = 0
+        self.resistances = []
+        self.rates = []
+        self._deadline = None
+        self._next = None
+        # Filled on the worker thread only, one pulse at a time
+        half = int(self.MAX_RATE * window) + 1
+        self._mono = array('d', bytes(16 * half))
+        self._voltage = array('d', bytes(16 * half))
+        self._current = array('d', bytes(16 * half))
+    
+    def start(self, start=None):
+        with self.lock:
+            self.running = True
+            self.pulses = 0
+            self._deadline = start or time.monotonic()
+            if self.low:
+                # The base current needs to settle before the first pulse
+                self.worker.submit(self._set_base)
+                self._deadline += self.window
+            future = self._schedule()
+        future.add_done_callback(self._after)
+    
+    def stop(self):
+        """Abandon the test and switch the load off (after a pulse in progress)."""
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+            # A pulse in progress can't be taken back; its _after() reports
+            in_progress = self._next is not None and not self._next.cancel()
+        self.worker.submit(lambda dl24: dl24.disable(), DL24Worker.PRIORITY_SAFETY)
+        if not in_progress:
+            print(f"{self.worker.session.port}: {self.report()}")
+    
+    def _schedule(self):
+        # With the lock held. The caller adds _after as done callback once it
+        # has released the lock: on a future that is already done (worker
+        # stopped) the callback runs right away, on the calling thread.
+        self._next = self.worker.submit_at(self._deadline, self._pulse)
+        return self._next
+    
+    def _set_base(self, dl24):
+        dl24.set_current(self.low)
+        dl24.enable()
+    
+    def _pulse(self, dl24):
+        # On the worker thread, inside the session's call()
+        half = len(self._mono) // 2
+        before = read_vi(dl24, self.window, self._mono, self._voltage, self._current, 0, half)
+        try:
+            dl24.set_current(self.high)
+            if not self.low:
+                dl24.enable()
+            t_step = time.monotonic()
+            end = read_vi(dl24, self.window, self._mono, self._voltage, self._current, half)
+        finally:
+            # Back to the base load even if the port fails mid-pulse, or at
+            # least off: the high current must not stay on
+            try:
+                if self.low:
+                    dl24.set_current(self.low)
+                else:
+                    dl24.disable()
+            except Exception:
+                dl24.disable()
+                raise
+        return before, half, t_step, end
+    
+    def _evaluate(self, before, half, t_step, end):
+        mono, voltage, current = self._mono, self._voltage, self._current
+        first = half
+        while first < end - 1 and mono[first] < t_step + self.settle:
+            first += 1
+        v0 = sum(voltage[:before]) / before
+        i0 = sum(current[:before]) / before
+        v1 = sum(voltage[first:end]) / (end - first)
+        i1 = sum(current[first:end]) / (end - first)
+        pairs = before + end - half
+        elapsed = mono[end - 1] - mono[0]
+        result = {'v_before': v0, 'i_before': i0, 'v_after': v1, 'i_after': i1,
+                  'samples_before': before, 'samples_after': end - half,
+                  'rate': pairs / elapsed if elapsed > 0 else None, 'resistance': None}
+        if abs(i1 - i0) >= self.MIN_STEP:
+            result['resistance'] = (v0 - v1) / (i1 - i0)
+        else:
+            result['detail'] = "no current step (cutoff?)"
+        return result
+    
+    def _after(self, future):
+        # On the worker thread, right after the pulse
+        if future.cancelled():
+            return
+        error = future.exception()
+        result = following = None
+        with self.lock:
+            if error is not None and not self.worker.running:
+                # The device is being closed: no pulse was taken, none will be
+                self.running = False
+            else:
+                result = self._result(future, error)
+            if self.count is not None and self.pulses >= self.count:
+                self.running = False
+            if self.running:
+                self._deadline += self.interval
+                following = self._schedule()
+            ended = not self.running
+        if result is not None:
+            result['t'] = datetime.datetime.now()
+            if self.on_result:
+                self.on_result(result)
+        if following is not None:
+            following.add_done_callback(self._after)
+        elif ended:
+            if self.low:
+                self.worker.submit(lambda dl24: dl24.disable(), DL24Worker.PRIORITY_SAFETY)
+            print(f"{self.worker.session.port}: {self.report()}")
+    
+    def _result(self, future, error):
+        self.pulses += 1
+        result = {'pulse': self.pulses, 'low': self.low, 'high': self.high}
+        if error is not None:
+            result.update(resistance=None, detail=str(error))
+        else:
+            result.update(self._evaluate(*future.result()))
+            if result['resistance'] is not None:
+                self.resistances.append(result['resistance'])
+                self.rates.append(result['rate'] or 0.0)
+            elif self.count is None:
+                self.running = False
+        return result
+    
+    @staticmethod
+    def describe(result):
+        if result['resistance'] is None:
+            return f"DCIR #{result['pulse']}: {result.get('detail', 'no result')}"
+        return (f"DCIR #{result['pulse']}: {result['resistance'] * 1000:.1f} mOhm "
+                f"({result['v_before']:.4f} V -> {result['v_after']:.4f} V, "
+                f"{result['i_before']:.3f} A -> {result['i_after']:.3f} A, "
+                f"{result['samples_before']}+{result['samples_after']} samples at {result['rate'] or 0:.0f} S/s)")
+    
+    def report(self):
+        if not self.resistances:
+            return f"DCIR: {self.pulses} pulse(s), no result"
+        mean = sum(self.resistances) / len(self.resistances)
+        return (f"DCIR: {self.pulses} pulse(s), R mean {mean * 1000:.1f} mOhm, min {min(self.resistances) * 1000:.1f}, "
+                f"max {max(self.resistances) * 1000:.1f} mOhm, "
+                f"{sum(self.rates) / len(self.rates):.0f} V/I pairs/s")
+
+
+class BurstCapture:
+    """
+    The fastest sampling the link allows, for a few seconds of transients
+    (load steps, cutoff). One worker command reads only voltage and current
+    in a tight loop (read_vi) into arrays allocated up front, for `seconds`
+    or until they are full: no CSV formatting, GUI queueing or prints until
+    it is over. Regular sampling picks up again at its next deadline (the
+    ones in between count as missed). save() then writes the burst as its
+    own CSV segment.
+    """
+    MAX_RATE = DCIRTest.MAX_RATE
+    HEADER = ['date', 'seconds', 'voltage', 'current']
+    
+    def __init__(self, seconds=5.0):
+        self.seconds = seconds
+        size = int(self.MAX_RATE * seconds) + 1
+        self.mono = array('d', bytes(8 * size))
+        self.voltage = array('d', bytes(8 * size))
+        self.current = array('d', bytes(8 * size))
+        self.count = 0
+        self.started = None  # (datetime, time.monotonic()) taken together before the loop
+    
+    def capture(self, dl24):
+        # On the worker thread, inside the session's call()
+        self.started = (datetime.datetime.now(), time.monotonic())
+        self.count = read_vi(dl24, self.seconds, self.mono, self.voltage, self.current)
+        return self
+    
+    @property
+    def duration(self):
+        return self.mono[self.count - 1] - self.mono[0] if self.count > 1 else 0.0
+    
+    @property
+    def rate(self):
+        return (self.count - 1) / self.duration if self.duration > 0 else 0.0
+    
+    def save(self, path):
+        t0, mono0 = self.started
+        f, wr = open_csv(path, False, self.HEADER)
+        with f:
+            wr.writerows([(t0 + datetime.timedelta(seconds=m - mono0)).strftime("%Y-%m-%d %H:%M:%S.%f"),
+                          f"{m - self.mono[0]:.6f}", f"{v:.3f}", f"{i:.3f}"]
+                         for m, v, i in zip(self.mono[:self.count], self.voltage[:self.count],
+                                            self.current[:self.count]))
+    
+    def report(self):
+        gap = max((b - a for a, b in zip(self.mono[:self.count - 1], self.mono[1:self.count])), default=0.0)
+        return (f"burst: {self.count} V/I pairs in {self.duration:.3f} s, {self.rate:.0f} samples/s "
+                f"(max gap {gap * 1000:.1f} ms)")
+
+
+class AsyncDL24Session:
+    """
+    asyncio front end for a DL24Session. Serial calls block, so they run on
+    one dedicated executor thread (which keeps them strictly ordered) and
+    are awaited with a timeout.
+    """
+    def __init__(self, session, timeout=2.0):
+        self.session = session
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"DL24 {session.port} io")
+    
+    async def call(self, operation, timeout=None):
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(self._executor, self.session.call, operation),
+                                      timeout or self.timeout)
+    
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class AsyncSink:
+    """
+    Output stage of the asyncio engine: consumes snapshots from its own queue
+    in a separate task, so a slow output never delays sampling.
+    A None item ends the stream.
+    
+    Subclasses implement `async handle(snap)`, which run() awaits for every
+    snapshot, or replace run() altogether (AsyncPlotSink batches instead).
+    """
+    def __init__(self):
+        self.queue = asyncio.Queue()
+    
+    async def run(self):
+        try:
+            while True:
+                snap = await self.queue.get()
+                if snap is None:
+                    break
+                await self.handle(snap)
+        finally:
+            await self.close()
+    
+    async def close(self):
+        pass
+
+
+class AsyncCsvSink(AsyncSink):
+    def __init__(self, log, port):
+        super().__init__()
+        self.log = log
+        self.port = port
+        log.attach()
+    
+    async def handle(self, snap):
+        # Only queues the row, the log's writer thread does the file I/O
+        self.log.add(snap, self.port)
+    
+    async def close(self):
+        self.log.detach()
+
+
+class AsyncConsoleSink(AsyncSink):
+    def __init__(self, prefix=""):
+        super().__init__()
+        self.prefix = prefix
+    
+    async def handle(self, snap):
+        print(console_line(snap, self.prefix))
+
+
+class AsyncPlotSink(AsyncSink):
+    """Collects snapshots and hands them over as one list every interval seconds."""
+    def __init__(self, on_batch, interval=0.2):
+        super().__init__()
+        self.on_batch = on_batch
+        self.interval = interval
+    
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.interval
+        batch = []
+        while True:
+            try:
+                snap = await asyncio.wait_for(self.queue.get(), max(deadline - loop.time(), 0))
+                if snap is None:
+                    break
+                batch.append(snap)
+            except asyncio.TimeoutError:
+                pass
+            if loop.time() >= deadline:
+                if batch:
+                    self.on_batch(batch)
+                    batch = []
+                deadline = loop.time() + self.interval
+        if batch:
+            self.on_batch(batch)
+
+
+async def sample_forever(session, scheduler, sinks, on_error=None):
+    """
+    asyncio sampler: reads a snapshot at every scheduler deadline and fans it
+    out to the sinks. Runs until cancelled.
+    """
+    last_error = None
+    while True:
+        # Short sleeps, so a new period (DeadlineScheduler.set_period) applies promptly
+        remaining = scheduler.time_to_deadline()
+        if remaining > 0:
+            await asyncio.sleep(min(remaining, 0.1))
+            continue
+        scheduler.tick()
+        try:
+            snap = await session.call(read_snapshot)
+        except Exception as e:
+            message = str(e) or type(e).__name__
+            if message != last_error and on_error:
+                on_error(e)
+            last_error = message
+            continue
+        last_error = None
+        for sink in sinks:
+            sink.queue.put_nowait(snap)
+
+
+class AsyncEngine:
+    """
+    Runs acquisitions as tasks on an asyncio loop in its own thread; an
+    alternative to sampling on DL24Worker. Each acquisition is one sampler
+    plus its sinks, so several devices and outputs share the loop thread.
+    """
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="DL24 asyncio", daemon=True)
+        self.thread.start()
+    
+    def start(self, session, scheduler, sinks, on_error=None, start=None):
+        """Start an acquisition; returns a Future, cancel it with stop()."""
+        scheduler.reset(start)
+        return asyncio.run_coroutine_threadsafe(self._acquire(session, scheduler, sinks, on_error), self.loop)
+    
+    async def _acquire(self, session, scheduler, sinks, on_error):
+        tasks = [asyncio.create_task(sink.run()) for sink in sinks]
+        try:
+            await sample_forever(session, scheduler, sinks, on_error)
+        finally:
+            # Let every sink drain and close its output
+            for sink in sinks:
+                sink.queue.put_nowait(None)
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def stop(self, run):
+        run.cancel()
+    
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5.0)
+
+
+def output_logs(out_path, append, combined, ports, **policy):
+    """
+    One log per port (port appended to the name when there are several),
+    or a single combined log with a port column. None without an output path.
+    A .dl24 extension selects the binary format (BinaryLog), anything else
+    CSV. policy (flush_rows, flush_seconds) is passed on to the log.
+    Raises ValueError when appending to a CSV with other columns, or to a
+    file that is not a binary log of the same ports.
+    """
+    if not out_path:
+        return {port: None for port in ports}
+    paths = log_paths(out_path, combined, ports)
+    if out_path.lower().endswith(".dl24"):
+        log_class = functools.partial(BinaryLog, ports=ports)
+        if append:
+            for path in set(paths.values()):
+                check_binlog_header(path, list(ports) if combined else None)
+    else:
+        log_class = CsvLog
+        if append:
+            for path in set(paths.values()):
+                check_csv_header(path, CSV_HEADER + ['port'] if combined else CSV_HEADER)
+    if combined:
+        log = log_class(out_path, append, with_port=True, **policy)
+        return {port: log for port in ports}
+    return {port: log_class(paths[port], append, **policy) for port in ports}
+
+
+def log_paths(out_path, combined, ports):
+    """File of each port's log, see output_logs()."""
+    if combined or len(ports) == 1:
+        return {port: out_path for port in ports}
+    base, ext = os.path.splitext(out_path)
+    return {port: f"{base} {port_name(port)}{ext or '.csv'}" for port in ports}
+
+
+def port_name(port):
+    """A port as part of a file name: /dev/ttyUSB0 -> ttyUSB0, COM6 stays COM6."""
+    name = port.replace("\\", "/").rstrip("/").rsplit("/", 1)[-1] or port
+    return "".join("_" if c in '\\/:*?"<>|' else c for c in name)
+
+
+class SampleBuffer:
+    """
+    Bounded hand-off of samples from an acquisition thread to the GUI.
+    Producers put() chunks, the GUI take()s what is there in one operation.
+    If the GUI falls more than `capacity` samples behind, every other
+    buffered sample is dropped, so the plot gets coarser rather than
+    shorter. This only thins what is displayed: the log gets every sample
+    from the producer directly.
+    """
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._items = []
+        self.taken = 0
+        self.dropped = 0
+        self.max_depth = 0
+    
+    def __len__(self):
+        return len(self._items)
+    
+    def put(self, samples):
+        with self._lock:
+            self._items.extend(samples)
+            while len(self._items) > self.capacity:
+                # Coalesce: keep the newest sample and every second one before it
+                kept = self._items[::-2][::-1]
+                self.dropped += len(self._items) - len(kept)
+                self._items = kept
+            self.max_depth = max(self.max_depth, len(self._items))
+    
+    def take(self, limit=None):
+        """
+        Removes and returns up to `limit` of the oldest samples (all by default).
+        """
+        with self._lock:
+            if limit is None or len(self._items) <= limit:
+                items, self._items = self._items, []
+            else:
+                items, self._items = self._items[:limit], self._items[limit:]
+        self.taken += len(items)
+        return items
+    
+    def report(self):
+        return (f"display queue {len(self._items)} (max {self.max_depth} of {self.capacity}), "
+                f"{self.dropped} sample(s) dropped for display")
+
+
+class DL24Device:
+    """
+    Everything needed to acquire from one DL24 port: the persistent session,
+    its own scheduler and I/O worker, the queue of samples for the GUI and
+    its CSV output. Every port has its own worker thread, so a slow or dead
+    device only delays itself.
+    """
+    def __init__(self, port, period=0.5):
+        self.port = port
+        self.session = DL24Session(port)
+        self.scheduler = DeadlineScheduler(period)
+        self.worker = DL24Worker(self.session, self.scheduler)
+        self.data_queue = SampleBuffer()
+        self.log = None
+        self.async_session = None
+        self.async_run = None
+        self.enabled = False
+        self.integrator = Integrator()
+        self.sequence = None
+        self.dcir = None
+        self.stats = LiveStats()
+    
+    def close(self):
+        # A profile or DCIR test still running is abandoned first: its
+        # disable is queued before the worker runs out its queue and stops
+        if self.sequence:
+            self.sequence.stop()
+        if self.dcir:
+            self.dcir.stop()
+        self.worker.stop()
+        if self.async_session is not None:
+            self.async_session.close()
+        self.session.close()
+
+
+class Integrator:
+    """
+    Local charge (mAh) and energy (Wh) by trapezoidal integration over the
+    monotonic time each sample was read (Snapshot.mono), so it does not
+    matter when or in what batches the samples are processed. A batch is
+    integrated with numpy in one go.
+    
+    The totals start from the device's own counters at the first sample, or
+    from the totals given to resume(). Every later sample is compared with
+    the counters; the result is kept as statistics for report() rather than
+    printed per sample.
+    """
+    TOLERANCE = 1.0  # %, deviation counted as "over"
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        self.last = None  # mono, voltage, current, charge, energy of the previous sample
+        self.start = None  # charge, energy the next sample starts from
+        self.checked = {"charge": 0, "energy": 0}
+        self.over = {"charge": 0, "energy": 0}
+        self.error = {"charge": 0.0, "energy": 0.0}
+        self.max_error = {"charge": 0.0, "energy": 0.0}
+    
+    def resume(self, charge, energy):
+        """
+        Continue from the totals of an earlier run (see App._resume) in a new
+        segment: the next sample starts from them, nothing is integrated over
+        the time the load was not sampled.
+        """
+        self.last = None
+        self.start = (charge, energy)
+    
+    def add(self, mono, voltage, current, device_charge, device_energy):
+        """
+        Integrates a batch of samples (equally long arrays in sample order)
+        and returns the local charge and energy at each of them.
+        """
+        power = voltage * current
+        if self.last is None:
+            charge0, energy0 = self.start or (device_charge[0], device_energy[0])
+            self.last = (mono[0], voltage[0], current[0], charge0, energy0)
+            self.start = None
+        t0, v0, i0, charge0, energy0 = self.last
+        dt = np.diff(mono, prepend=t0)
+        previous_current = np.concatenate(([i0], current[:-1]))
+        previous_power = np.concatenate(([v0 * i0], power[:-1]))
+        # (a + b) / 2 * dt, in A*s -> mAh and W*s -> Wh
+        charge = charge0 + np.cumsum((current + previous_current) * dt) / 7.2
+        energy = energy0 + np.cumsum((power + previous_power) * dt) / 7200.0
+        self.last = (mono[-1], voltage[-1], current[-1], charge[-1], energy[-1])
+        
+        self._check("charge", charge, device_charge, 0.01)
+        self._check("energy", energy, device_energy, 0.0001)
+        return charge, energy
+    
+    def _check(self, name, local, device, minimum):
+        valid = device > minimum
+        if not valid.any():
+            return
+        error = np.abs(local[valid] - device[valid]) / device[valid] * 100.0
+        self.checked[name] += len(error)
+        self.over[name] += int(np.count_nonzero(error > self.TOLERANCE))
+        self.error[name] = error[-1]
+        self.max_error[name] = max(self.max_error[name], error.max())
+    
+    def report(self):
+        return " | ".join(
+            f"{name} vs device {self.error[name]:.2f} % (max {self.max_error[name]:.2f} %, "
+            f"{self.over[name]}/{self.checked[name]} over {self.TOLERANCE:g} %)"
+            for name in ("charge", "energy"))
+
+
+class RunningStats:
+    """
+    Count, min, max, mean and variance (Welford) of one channel, plus
+    approximate percentiles from a Histogram over EDGES: log-spaced by 0.5 %
+    from 1 mV / 1 mA to 1000, so a percentile is within 0.5 % of the true
+    value. Constant time and memory per value, however long the run.
+    """
+    EDGES = tuple(1e-3 * 1.005 ** k for k in range(2771))
+    
+    def __init__(self):
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.histogram = Histogram(self.EDGES)
+    
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.histogram.add(value)
+    
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+    
+    def percentile(self, p):
+        return self.histogram.percentile(p)
+    
+    def summary(self, name, unit, spec):
+        if not self.count:
+            return f"{name} -"
+        values = " ".join(f"{label} {self.percentile(q):{spec}}" for label, q in (("p5", 5), ("p50", 50), ("p95", 95)))
+        return (f"{name} {self.mean:{spec}} {unit} [{self.min:{spec}}..{self.max:{spec}}] "
+                f"sd {math.sqrt(self.variance):{spec}} {values}")
+
+
+class CutoffEstimator:
+    """
+    Time, charge and energy left until the voltage reaches the cutoff, from
+    a straight line through the recent voltage. The fit is an exponentially
+    weighted least squares over time constant `window` seconds, kept as five
+    running sums re-centred on the newest sample (constant time and memory,
+    no loss of precision on multi-day runs). Remaining charge and energy use
+    the weighted mean current and power over the same window.
+    
+    A discharge curve steepens towards its end, so the estimate is
+    optimistic until the knee is inside the window. The fit restarts when
+    the load is off (current below MIN_CURRENT) and gives no estimate
+    before it covers a quarter of the window.
+    """
+    MIN_CURRENT = 0.01  # A
+    
+    def __init__(self, window=300.0):
+        self.window = window
+        self.reset()
+    
+    def reset(self):
+        self.first = self.last = None
+        self._w = self._t = self._tt = self._v = self._tv = self._i = self._p = 0.0
+    
+    def add(self, mono, voltage, current):
+        if current < self.MIN_CURRENT:
+            self.reset()
+            return
+        if self.last is None:
+            self.first = mono
+        else:
+            # Move the origin to this sample, then let the old ones decay
+            d = mono - self.last
+            decay = math.exp(-d / self.window)
+            self._tt = (self._tt - 2 * d * self._t + d * d * self._w) * decay
+            self._tv = (self._tv - d * self._v) * decay
+            self._t = (self._t - d * self._w) * decay
+            self._w *= decay
+            self._v *= decay
+            self._i *= decay
+            self._p *= decay
+        self.last = mono
+        self._w += 1.0
+        self._v += voltage
+        self._i += current
+        self._p += voltage * current
+    
+    @property
+    def slope(self):
+        """V/s of the fit, None while there is none."""
+        if self.last is None or self.last - self.first < self.window / 4:
+            return None
+        mean_t = self._t / self._w
+        var_t = self._tt / self._w - mean_t * mean_t
+        if var_t <= 0:
+            return None
+        return (self._tv / self._w - mean_t * self._v / self._w) / var_t
+    
+    def estimate(self, cutoff):
+        """(seconds, mAh, Wh) left until cutoff (V), None if not falling towards it."""
+        slope = self.slope
+        if slope is None or cutoff is None or slope >= 0:
+            return None
+        voltage = self._v / self._w - slope * self._t / self._w  # fit value now
+        if voltage <= cutoff:
+            return 0.0, 0.0, 0.0
+        seconds = (cutoff - voltage) / slope
+        return seconds, self._i / self._w * seconds / 3.6, self._p / self._w * seconds / 3600.0
+
+
+class LiveStats:
+    """
+    The streaming statistics of one device: a RunningStats per channel and
+    the CutoffEstimator, fed sample by sample (from any one thread at a
+    time). cutoff is the device's voltage cutoff setting when known.
+    """
+    CHANNELS = (("voltage", "V", "V", ".3f"), ("current", "I", "A", ".3f"), ("power", "P", "W", ".2f"),
+                ("temp", "T", "°C", ".1f"))
+    
+    def __init__(self, window=300.0):
+        self.channels = {name: RunningStats() for name, _, _, _ in self.CHANNELS}
+        self.estimator = CutoffEstimator(window)
+        self.cutoff = None
+    
+    def reset(self):
+        for stats in self.channels.values():
+            stats.__init__()
+        self.estimator.reset()
+    
+    def add(self, mono, voltage, current, temp):
+        channels = self.channels
+        channels["voltage"].add(voltage)
+        channels["current"].add(current)
+        channels["power"].add(voltage * current)
+        channels["temp"].add(temp)
+        self.estimator.add(mono, voltage, current)
+    
+    def summary(self):
+        lines = [self.channels[name].summary(label, unit, spec) for name, label, unit, spec in self.CHANNELS]
+        slope = self.estimator.slope
+        if slope is None:
+            lines.append("to cutoff: -")
+            return "\n".join(lines)
+        estimate = self.estimator.estimate(self.cutoff)
+        line = f"slope {slope * 60000:.2f} mV/min"
+        if estimate is None:
+            line += ", to cutoff: -" if self.cutoff is not None else ", cutoff unknown"
+        else:
+            seconds, charge, energy = estimate
+            line += (f", to cutoff {self.cutoff:g} V: {datetime.timedelta(seconds=int(seconds))}, "
+                     f"{charge:.0f} mAh, {energy:.2f} Wh")
+        lines.append(line)
+        return "\n".join(lines)
+
+
+class SeriesStore:
+    """
+    Columnar time series in preallocated numpy arrays. Capacity doubles when
+    full, so extend() is amortized O(1) per row; view() returns zero-copy
+    slices of the filled part and clear() is O(1), keeping the allocation.
+    """
+    def __init__(self, columns, capacity=4096):
+        self.columns = tuple(columns)
+        self._data = {name: np.empty(capacity) for name in self.columns}
+        self.n = 0
+    
+    def __len__(self):
+        return self.n
+    
+    @property
+    def capacity(self):
+        return len(self._data[self.columns[0]])
+    
+    def _reserve(self, size):
+        if size <= self.capacity:
+            return
+        capacity = max(size, self.capacity * 2)
+        for name, old in self._data.items():
+            new = np.empty(capacity)
+            new[:self.n] = old[:self.n]
+            self._data[name] = new
+    
+    def extend(self, **arrays):
+        """Several rows at once, one equally long array per column."""
+        count = len(next(iter(arrays.values())))
+        self._reserve(self.n + count)
+        for name, values in arrays.items():
+            self._data[name][self.n:self.n + count] = values
+        self.n += count
+    
+    def view(self, name):
+        return self._data[name][:self.n]
+    
+    def clear(self):
+        self.n = 0
+
+
+class MinMaxDecimator:
+    """
+    Incremental min/max decimation of a SeriesStore for plotting.
+    
+    New samples are folded into buckets of `size` samples, each remembering
+    the index of its minimum and maximum per column. When there are more than
+    twice `buckets` of them, neighbours are merged and the bucket size
+    doubles, so there are between one and two times `buckets` buckets (two
+    points each) however long the run gets, and every peak and dip remains
+    visible. The samples of the unfinished bucket are summarised again on
+    every call.
+    """
+    def __init__(self, store, x, columns, buckets=400):
+        self.store = store
+        self.x = x
+        self.columns = tuple(columns)
+        self.buckets = buckets
+        self.reset()
+    
+    def reset(self, buckets=None):
+        if buckets:
+            self.buckets = max(int(buckets), 16)
+        self.size = 1    # samples per bucket
+        self.done = 0    # samples folded into complete buckets
+        self.count = 0   # complete buckets
+        limit = 2 * self.buckets + 1
+        self._lo = {name: np.empty(limit, dtype=np.int64) for name in self.columns}
+        self._hi = {name: np.empty(limit, dtype=np.int64) for name in self.columns}
+    
+    def resize(self, buckets):
+        """
+        Retarget to a new width; rebuilds only when it changed by over 25 %.
+        """
+        if abs(buckets - self.buckets) > self.buckets // 4:
+            self.reset(buckets)
+    
+    def _fold(self, n):
+        if self.count == 0:
+            # Starting over (first call, reset, resize): pick the bucket size
+            # directly instead of merging our way up from single samples
+            while n // self.size > 2 * self.buckets:
+                self.size *= 2
+        full = min((n - self.done) // self.size, 2 * self.buckets + 1 - self.count)
+        if full <= 0:
+            return False
+        start, stop = self.done, self.done + full * self.size
+        base = start + np.arange(full) * self.size
+        for name in self.columns:
+            block = self.store.view(name)[start:stop].reshape(full, self.size)
+            self._lo[name][self.count:self.count + full] = base + block.argmin(axis=1)
+            self._hi[name][self.count:self.count + full] = base + block.argmax(axis=1)
+        self.count += full
+        self.done = stop
+        if self.count > 2 * self.buckets:
+            self._merge()
+        return True
+    
+    def _merge(self):
+        pairs = self.count // 2
+        for name in self.columns:
+            values = self.store.view(name)
+            for index, better in ((self._lo[name], np.less), (self._hi[name], np.greater)):
+                a = index[0:2 * pairs:2]
+                b = index[1:2 * pairs:2]
+                index[:pairs] = np.where(better(values[b], values[a]), b, a)
+        if self.count % 2:
+            # An odd bucket out cannot be merged; unfold it at the new size
+            self.done -= self.size
+        self.count = pairs
+        self.size *= 2
+    
+    def update(self):
+        """
+        Fold in what was appended since the last call; picks up a cleared store.
+        """
+        n = len(self.store)
+        if n < self.done:
+            self.reset()
+        while self._fold(n):
+            pass
+    
+    def points(self, name):
+        """
+        (x, y) arrays of the decimated `name` column, in time order.
+        """
+        self.update()
+        lo = self._lo[name][:self.count]
+        hi = self._hi[name][:self.count]
+        index = np.empty(2 * self.count, dtype=np.int64)
+        index[0::2] = np.minimum(lo, hi)
+        index[1::2] = np.maximum(lo, hi)
+        n = len(self.store)
+        if n:
+            # Always end at the newest sample
+            extra = {n - 1}
+            if self.done < n:
+                tail = self.store.view(name)[self.done:n]
+                extra.update((self.done + int(tail.argmin()), self.done + int(tail.argmax())))
+            index = np.concatenate((index, sorted(extra)))
+        return self.store.view(self.x)[index], self.store.view(name)[index]
+
+
+class PlotPanel:
+    """
+    Four-axis V/I/mAh/Wh figure of one device together with the recorded
+    series it shows.
+    
+    With blit=True (live plots) the lines are animated: a full draw caches
+    the static background (axes, ticks, legend) and a normal tick only
+    restores it and redraws the four lines. Axis limits grow with HEADROOM
+    to spare and only when new data leaves them, which is the only time a
+    full redraw happens. The log viewer, which zooms and pans through the
+    toolbar, uses the ordinary full redraw.
+    """
+    HEADROOM = 0.25              # fraction of the data span added on a rescale
+    MIN_TIME_HEADROOM = 1 / 1440 # one minute, in date units (days)
+    
+    def __init__(self, master, blit=False):
+        # Recorded data; date as matplotlib date numbers (float days, local time)
+        self.series = SeriesStore(("date", "voltage", "current", "charge", "energy"))
+        self.decimator = MinMaxDecimator(self.series, "date", ("voltage", "current", "charge", "energy"))
+        self.dirty = False       # new data since the last update()
+        self.background = None
+        self.rescale = True      # set limits from scratch on the next update
+        self.blit = blit
+        
+        self.fig = Figure(figsize=(8.5, 7))
+        self.ax1 = self.fig.add_subplot(111)
+        self.ax2 = self.ax1.twinx()
+        self.ax3 = self.ax1.twinx()
+        self.ax4 = self.ax1.twinx()
+        
+        # Move the tick labels of ax3 to the left of its own spine
+        self.ax3.yaxis.tick_left()
+        self.ax3.yaxis.set_label_position("left")
+        self.ax3.tick_params(axis='y', which='both', direction='out', colors='blue')
+        self.ax3.spines["left"].set_position(("axes", 1.0))
+        
+        self.ax4.spines["right"].set_position(("axes", 0.00))
+        self.ax4.tick_params(axis='y', which='both', direction='out', colors='orange')
+        self.ax1.xaxis_date()
+        
+        self.fig.set_size_inches(8.5, 7)
+        self.canvas = FigureCanvasTkAgg(self.fig, master=master)
+        self.canvas_widget = self.canvas.get_tk_widget()
+        
+        # -- Create empty Line2D objects & store references --
+        (self.line_voltage,) = self.ax1.plot([], [], color='green', label='Voltage')
+        (self.line_current,) = self.ax2.plot([], [], color='red',   label='Current')
+        (self.line_charge,)  = self.ax3.plot([], [], color='blue',  linestyle='--', label='Charge')
+        (self.line_energy,)  = self.ax4.plot([], [], color='orange',linestyle='-.', label='Energy')
+        self.lines = ((self.ax1, self.line_voltage), (self.ax2, self.line_current),
+                      (self.ax3, self.line_charge), (self.ax4, self.line_energy))
+        if self.blit:
+            for ax, line in self.lines:
+                line.set_animated(True)
+            self.canvas.mpl_connect('draw_event', self._on_draw)
+        
+        # Format the axes once
+        self.ax1.set_ylabel("Voltage (V)", color='green')
+        self.ax2.set_ylabel("Current (A)", color='red')
+        self.ax3.set_ylabel("Charge (mAh)", color='blue')
+        self.ax4.set_ylabel("Energy (Wh)", color='orange')
+        
+        # Y-axis format
+        self.ax1.yaxis.set_major_formatter(FormatStrFormatter('%g V'))
+        self.ax2.yaxis.set_major_formatter(FormatStrFormatter('%g A'))
+        self.ax3.yaxis.set_major_formatter(FormatStrFormatter('%g mAh'))
+        self.ax4.yaxis.set_major_formatter(FormatStrFormatter('%g Wh'))
+        
+        # Gather lines from each axes to create combined legend once
+        lines1, labels1 = self.ax1.get_legend_handles_labels()
+        lines2, labels2 = self.ax2.get_legend_handles_labels()
+        lines3, labels3 = self.ax3.get_legend_handles_labels()
+        lines4, labels4 = self.ax4.get_legend_handles_labels()
+        self.ax1.legend(lines1 + lines2 + lines3 + lines4,
+                        labels1 + labels2 + labels3 + labels4,
+                        loc='best')
+        
+        # Force initial draw
+        self.canvas.draw()
+    
+    def clear(self):
+        self.series.clear()
+        self.decimator.reset()
+        self.rescale = True
+        self.dirty = True
+    
+    def _on_draw(self, event):
+        # A full draw (first show, resize, rescale): keep the static parts
+        # and put the animated lines back on top
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_lines()
+    
+    def _draw_lines(self):
+        for ax, line in self.lines:
+            ax.draw_artist(line)
+    
+    def _grow_limits(self):
+        """
+        Widen any axis the data has left, with headroom. Returns True if a
+        limit changed, i.e. the background needs a full redraw.
+        """
+        changed = False
+        x = self.line_voltage.get_xdata()
+        if len(x) == 0:
+            return False
+        x0, x1 = self.ax1.get_xlim()
+        if self.rescale or x[0] < x0 or x[-1] > x1:
+            ahead = max((x[-1] - x[0]) * self.HEADROOM, self.MIN_TIME_HEADROOM)
+            self.ax1.set_xlim(x[0], x[-1] + ahead)
+            changed = True
+        for ax, line in self.lines:
+            y = line.get_ydata()
+            lo, hi = y.min(), y.max()
+            y0, y1 = ax.get_ylim()
+            if self.rescale or lo < y0 or hi > y1:
+                pad = max(hi - lo, abs(hi) * 0.05, 1e-3) * self.HEADROOM
+                ax.set_ylim(lo - pad, hi + pad)
+                changed = True
+        self.rescale = False
+        return changed
+    
+    def update(self):
+        """
+        Update the data in the existing line objects without clearing axes.
+        Then refresh the figure.
+        """
+        self.dirty = False
+        
+        # 1) Update each line's data, min/max decimated to at most one
+        #    min/max pair per pixel of canvas width (half as many buckets), so
+        #    the cost does not grow with the run
+        width = self.canvas_widget.winfo_width()
+        if width > 1:
+            self.decimator.resize(width // 2)
+        self.line_voltage.set_data(*self.decimator.points('voltage'))
+        self.line_current.set_data(*self.decimator.points('current'))
+        self.line_charge.set_data(*self.decimator.points('charge'))
+        self.line_energy.set_data(*self.decimator.points('energy'))
+        
+        if self.blit:
+            # 2) Grow limits only when needed, else blit the lines alone
+            if self._grow_limits() or self.background is None:
+                self.canvas.draw_idle()
+            else:
+                self.canvas.restore_region(self.background)
+                self._draw_lines()
+                self.canvas.blit(self.fig.bbox)
+            return
+
+        # 2) Update the axis limits so new data points are visible
+        self.ax1.relim()  # Recalculate limits for ax1
+        self.ax1.autoscale_view()
 
-COM_Port = "COM6"
+        self.ax2.relim()
+        self.ax2.autoscale_view()
+
+        self.ax3.relim()
+        self.ax3.autoscale_view()
+
+        self.ax4.relim()
+        self.ax4.autoscale_view()
+
+        # 3) Finally, redraw the figure
+        self.canvas.draw_idle()
+
+
+class MappedLog:
+    """
+    Read-only, memory-mapped access to a finished recording. Binary .dl24
+    logs map straight onto a numpy record array; CSVs get an index of line
+    start offsets, built once with numpy and cached as <file>.idx.npy,
+    which is memory-mapped as well. Rows are only decoded for the time range and resolution asked for, so
+    opening a large run costs neither time nor RAM in proportion to its size.
+    """
+    INDEX_CHUNK = 64 * 1024 * 1024
+    
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.binary = self.mm[:len(BIN_MAGIC)] == BIN_MAGIC
+        if self.binary:
+            schema, offset = read_binlog_header(self.file)
+            self.ports = schema.get("ports")
+            dtype = binlog_dtype()
+            self.count = (len(self.mm) - offset) // dtype.itemsize
+            self.records = np.frombuffer(self.mm, dtype=dtype, count=self.count, offset=offset)
+        else:
+            header = self.mm[:self.mm.find(b"\n") + 1].decode().strip().split(",")
+            self.columns = {name: i for i, name in enumerate(header)}
+            self.offsets = self._row_index()
+            self.count = len(self.offsets) - 1
+            self.ports = None
+            if 'port' in self.columns:
+                self.ports = sorted({row[-1] for row in self._rows(0, min(self.count, 1000), 1)})
+    
+    def _row_index(self):
+        size = len(self.mm)
+        index_path = self.path + ".idx.npy"
+        try:
+            offsets = np.load(index_path, mmap_mode='r')
+            if len(offsets) and offsets[-1] == size:
+                return offsets
+        except (OSError, ValueError):
+            pass
+        offsets = None  # unmaps a stale index before it is written again
+        # Every line starts after a newline, the first one after the header.
+        # Counted first, then written chunk by chunk straight into the index
+        # file: 8 bytes per row, never held in memory as a whole.
+        data = np.frombuffer(self.mm, dtype=np.uint8)
+        chunks = range(0, size, self.INDEX_CHUNK)
+        count = sum(int(np.count_nonzero(data[start:start + self.INDEX_CHUNK] == 10)) for start in chunks)
+        length = count + (data[-1] != 10)   # last line without newline
+        try:
+            offsets = np.lib.format.open_memmap(index_path, mode='w+', dtype=np.uint64, shape=(length,))
+        except OSError:
+            offsets = np.empty(length, dtype=np.uint64)
+        n = 0
+        for start in chunks:
+            newlines = np.flatnonzero(data[start:start + self.INDEX_CHUNK] == 10) + (start + 1)
+            offsets[n:n + len(newlines)] = newlines
+            n += len(newlines)
+        if n < length:
+            offsets[n] = size
+        if isinstance(offsets, np.memmap):
+            offsets.flush()
+        return offsets
+    
+    def _row(self, i):
+        # A decoded CSV row, None for repeated header rows (appended runs) and torn lines
+        row = self.mm[int(self.offsets[i]):int(self.offsets[i + 1])].decode(errors="replace").strip().split(",")
+        if len(row) >= len(CSV_HEADER) and row[0] != "date":
+            return row
+        return None
+    
+    def _rows(self, start, stop, step):
+        for i in range(start, stop, step):
+            row = self._row(i)
+            if row is not None:
+                yield row
+    
+    def _port_rows(self, start, stop, step, port):
+        # One port of a combined log: from every step-th row on, the next row of that port
+        i = start
+        for mark in range(start, stop, step):
+            i = max(i, mark)
+            while i < stop:
+                row = self._row(i)
+                i += 1
+                if row is not None and row[-1] == port:
+                    yield row
+                    break
+    
+    def _port_records(self, start, stop, points, port):
+        # Row numbers of one port of a binary log, strided over that port's
+        # records only; found in chunks, so a full range is never one index array
+        ports = self.records['port']
+        index = self.ports.index(port)
+        chunks = range(start, stop, self.INDEX_CHUNK)
+        count = sum(int(np.count_nonzero(ports[i:min(i + self.INDEX_CHUNK, stop)] == index)) for i in chunks)
+        step = max(count // max(points, 1), 1)
+        picked = [np.zeros(0, dtype=np.int64)]
+        seen = 0
+        for i in chunks:
+            rows = np.flatnonzero(ports[i:min(i + self.INDEX_CHUNK, stop)] == index) + i
+            picked.append(rows[-seen % step::step])
+            seen += len(rows)
+        return np.concatenate(picked)
+    
+    def _csv_time(self, i):
+        for row in self._rows(i, min(i + 10, self.count), 1):
+            try:
+                return datetime.datetime.fromisoformat(row[0]).timestamp()
+            except ValueError:
+                continue
+        return float("inf")
+    
+    def time_at(self, i):
+        """Epoch timestamp of row i."""
+        if self.binary:
+            return float(self.records['t'][i])
+        return self._csv_time(i)
+    
+    def index_of(self, t):
+        if self.binary:
+            return int(np.searchsorted(self.records['t'], t))
+        return bisect.bisect_left(range(self.count), t, key=self._csv_time)
+    
+    def read(self, t_start, t_end, points, port=None):
+        """
+        About `points` evenly strided rows between two epoch times, as a dict
+        of numpy arrays t (epoch), voltage, current, charge, energy. With
+        `port`, the rows of that port of a combined log; they are selected
+        before striding, so the ports' interleaving can't alias them away.
+        """
+        i0 = max(self.index_of(t_start) - 1, 0)
+        i1 = min(self.index_of(t_end) + 1, self.count)
+        step = max((i1 - i0) // max(points, 1), 1)
+        if port is not None and not self.ports:
+            port = None
+        if self.binary:
+            if port is None:
+                rec = np.array(self.records[i0:i1:step])
+            else:
+                rec = self.records[self._port_records(i0, i1, points, port)]
+            return {name: rec[name].astype(float) for name in ('t', 'voltage', 'current', 'charge', 'energy')}
+        
+        c = self.columns
+        columns = {'t': [], 'voltage': [], 'current': [], 'charge': [], 'energy': []}
+        rows = self._rows(i0, i1, step) if port is None else self._port_rows(i0, i1, step, port)
+        for row in rows:
+            try:
+                values = (datetime.datetime.fromisoformat(row[c['date']]).timestamp(), float(row[c['voltage']]),
+                          float(row[c['current']]), float(row[c['device_charge']]), float(row[c['device_energy']]))
+            except ValueError:
+                continue
+            for name, value in zip(columns, values):
+                columns[name].append(value)
+        return {name: np.asarray(values, dtype=float) for name, values in columns.items()}
+    
+    def close(self):
+        if self.binary:
+            del self.records
+        else:
+            self.offsets = None
+        self.mm.close()
+        self.file.close()
+
+
+class LogViewer:
+    """
+    "View log" window: a MappedLog drawn in the four-axis figure. After
+    every pan or zoom only the visible range is read again, at about the
+    resolution of the canvas.
+    """
+    def __init__(self, master, path):
+        self.log = MappedLog(path)
+        self.window = tk.Toplevel(master)
+        self.window.title(f"DL24 log: {os.path.basename(path)}")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self._pending = None
+        
+        self.plot = PlotPanel(self.window)
+        self.plot.canvas_widget.grid(row=1, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
+        toolbar_frame = ttk.Frame(self.window)
+        toolbar_frame.grid(row=0, column=0, sticky="w")
+        self.toolbar = NavigationToolbar2Tk(self.plot.canvas, toolbar_frame, pack_toolbar=False)
+        self.toolbar.update()
+        self.toolbar.pack(side=tk.LEFT)
+        
+        # Combined logs: one port at a time
+        self.port_var = tk.StringVar(self.window, value=self.log.ports[0] if self.log.ports else "")
+        if self.log.ports:
+            port_box = ttk.Combobox(self.window, textvariable=self.port_var, values=self.log.ports, state="readonly")
+            port_box.grid(row=0, column=1, padx=10, sticky="e")
+            port_box.bind("<<ComboboxSelected>>", lambda event: self._reload())
+        
+        if self.log.count:
+            first, last = self.log.time_at(0), self.log.time_at(self.log.count - 1)
+            self._reload(first, last)
+            x0, x1 = self._to_num(np.array([first, last]))
+            if x0 == x1:
+                x1 = x0 + 1 / 86400
+            self.plot.ax1.set_xlim(x0, x1)
+        self.plot.ax1.callbacks.connect('xlim_changed', self._on_xlim)
+        print(f"Opened {path}: {self.log.count} records")
+    
+    @staticmethod
+    def _to_num(epoch):
+        # Plot in local time like the live view and the CSV
+        return mdates.date2num([datetime.datetime.fromtimestamp(t) for t in epoch])
+    
+    def _on_xlim(self, ax):
+        # Pan/zoom fires this many times, reload once it has settled
+        if self._pending is None:
+            self._pending = self.window.after(150, self._reload)
+    
+    def _reload(self, t_start=None, t_end=None):
+        self._pending = None
+        if t_start is None:
+            x0, x1 = self.plot.ax1.get_xlim()
+            t_start, t_end = (mdates.num2date(x).replace(tzinfo=None).timestamp() for x in (x0, x1))
+        points = max(self.plot.canvas_widget.winfo_width(), 200) * 2
+        data = self.log.read(t_start, t_end, points, self.port_var.get() or None)
+        x = self._to_num(data['t'])
+        for line, name in ((self.plot.line_voltage, 'voltage'), (self.plot.line_current, 'current'),
+                           (self.plot.line_charge, 'charge'), (self.plot.line_energy, 'energy')):
+            line.set_data(x, data[name])
+        for ax in (self.plot.ax1, self.plot.ax2, self.plot.ax3, self.plot.ax4):
+            ax.relim()
+            ax.autoscale_view(scalex=False)
+        self.plot.canvas.draw_idle()
+    
+    def close(self):
+        self.window.destroy()
+        self.log.close()
 
 
 class App:
@@ -28,20 +2580,21 @@ class App:
         self.root = root
         self.root.title("DL24 Data Collection and Plotting")
         root.protocol("WM_DELETE_WINDOW", self.on_closing)
-        self.com_port_lock = threading.Lock()
+        # Results of device commands are handed back to the Tk thread here
+        self.ui_calls = queue.SimpleQueue()
         # Variables
         self.output_var = tk.StringVar()
         self.append_var = tk.BooleanVar()
         self.debug_var = tk.BooleanVar()
         self.override_var = tk.BooleanVar()
+        self.async_var = tk.BooleanVar()
+        self.combined_var = tk.BooleanVar()
+        self.resume_var = tk.BooleanVar()
         
-        # Lists for storing recorded data
-        self.date_series = []
-        
-        self.voltage_series = []
-        self.current_series = []
-        self.energy_series = []
-        self.charge_series = []
+        # One DL24Device and one PlotPanel per port
+        self.devices = {}
+        self.plots = {}
+        self.tabs = {}
     
         # Automatic filename setup for the CSV output
         current_datetime = datetime.datetime.now().strftime('%Y.%m.%d %H-%M-%S')
@@ -53,129 +2606,187 @@ class App:
         
         ttk.Checkbutton(root, text="Append", variable=self.append_var).grid(row=1, column=1, sticky="w")
         ttk.Checkbutton(root, text="Override", variable=self.override_var).grid(row=1, column=1)
+        ttk.Checkbutton(root, text="Combined log", variable=self.combined_var).grid(row=1, column=1, sticky="e")
         ttk.Checkbutton(root, text="Debug", variable=self.debug_var).grid(row=2, column=1, sticky="w")
+        ttk.Checkbutton(root, text="asyncio engine", variable=self.async_var).grid(row=2, column=1)
+        ttk.Checkbutton(root, text="Resume", variable=self.resume_var).grid(row=2, column=1, sticky="e")
+        
+        # Sampling period, applied immediately also while collecting
+        self.period_var = tk.StringVar(root, value="0.5")
+        ttk.Label(root, text="Sample period (s):").grid(row=4, column=0, sticky="e")
+        period_box = ttk.Combobox(root, textvariable=self.period_var,
+                                  values=("0.1", "0.2", "0.5", "1", "2", "5", "10", "30", "60", "300"))
+        period_box.grid(row=4, column=1, padx=10, pady=5, sticky="ew")
+        period_box.bind("<<ComboboxSelected>>", lambda event: self.set_sample_period())
+        period_box.bind("<Return>", lambda event: self.set_sample_period())
+        ttk.Button(root, text="Set", command=self.set_sample_period).grid(row=4, column=2, padx=5, pady=5)
+        self.rate_var = tk.StringVar(root, value="Rate: -")
+        ttk.Label(root, textvariable=self.rate_var).grid(row=5, column=0, columnspan=3, padx=10, sticky="w")
         
     
         # Data collection buttons
         self.start_btn = ttk.Button(root, text="Start", command=self.toggle_data_collection)
-        self.start_btn.grid(row=3, column=0, columnspan=3, pady=10, sticky="ew")
+        self.start_btn.grid(row=3, column=0, columnspan=2, pady=10, sticky="ew")
+        ttk.Button(root, text="Burst", command=self.run_burst).grid(row=3, column=2, padx=5, pady=10, sticky="ew")
+        
+        # Devices: comma separated list of ports, commands go to the selected one
+        self.ports_var = tk.StringVar(root, value=COM_Port)
+        ttk.Label(root, text="Ports:").grid(row=6, column=0, sticky="e")
+        ttk.Entry(root, textvariable=self.ports_var).grid(row=6, column=1, padx=10, pady=5, sticky="ew")
+        ttk.Button(root, text="Apply", command=self.set_ports).grid(row=6, column=2, padx=5, pady=5)
         
+        self.device_var = tk.StringVar(root, value=COM_Port)
+        ttk.Label(root, text="Commands to:").grid(row=7, column=0, sticky="e")
+        self.device_box = ttk.Combobox(root, textvariable=self.device_var, state="readonly")
+        self.device_box.grid(row=7, column=1, padx=10, pady=5, sticky="ew")
+        self.device_box.bind("<<ComboboxSelected>>", lambda event: self.select_device())
 
         # DL24 Management Widgets with current settings
         self.current_var = tk.StringVar(root, value="Current setting")
-        ttk.Label(root, textvariable=self.current_var).grid(row=6, column=0, sticky="e")
+        ttk.Label(root, textvariable=self.current_var).grid(row=8, column=0, sticky="e")
         self.current_entry = ttk.Entry(root)
-        self.current_entry.grid(row=6, column=1, padx=10, pady=5, sticky="ew")
-        ttk.Button(root, text="Set", command=self.set_dl24_current).grid(row=6, column=2, padx=5, pady=5)
+        self.current_entry.grid(row=8, column=1, padx=10, pady=5, sticky="ew")
+        ttk.Button(root, text="Set", command=self.set_dl24_current).grid(row=8, column=2, padx=5, pady=5)
     
         self.voltage_cutoff_var = tk.StringVar(root, value="Voltage cutoff setting")
-        ttk.Label(root, textvariable=self.voltage_cutoff_var).grid(row=7, column=0, sticky="e")
+        ttk.Label(root, textvariable=self.voltage_cutoff_var).grid(row=9, column=0, sticky="e")
         self.voltage_cutoff_entry = ttk.Entry(root)
-        self.voltage_cutoff_entry.grid(row=7, column=1, padx=10, pady=5, sticky="ew")
-        ttk.Button(root, text="Set", command=self.set_dl24_voltage_cutoff).grid(row=7, column=2, padx=5, pady=5)
+        self.voltage_cutoff_entry.grid(row=9, column=1, padx=10, pady=5, sticky="ew")
+        ttk.Button(root, text="Set", command=self.set_dl24_voltage_cutoff).grid(row=9, column=2, padx=5, pady=5)
     
         self.timer_var = tk.StringVar(root, value="Timer setting")
-        ttk.Label(root, textvariable=self.timer_var).grid(row=8, column=0, sticky="e")
+        ttk.Label(root, textvariable=self.timer_var).grid(row=10, column=0, sticky="e")
         self.timer_entry = ttk.Entry(root)
-        self.timer_entry.grid(row=8, column=1, padx=10, pady=5, sticky="ew")
-        ttk.Button(root, text="Set", command=self.set_dl24_timer).grid(row=8, column=2, padx=5, pady=5)
+        self.timer_entry.grid(row=10, column=1, padx=10, pady=5, sticky="ew")
+        ttk.Button(root, text="Set", command=self.set_dl24_timer).grid(row=10, column=2, padx=5, pady=5)
     
-        # DL24 enable/disable merged button
-        self.dl24_button_state = False  # False = disabled, True = enabled
+        # DL24 enable/disable merged button, reflects the selected device
         self.dl24_toggle_btn = ttk.Button(root, text="Enable DL24", command=self.toggle_dl24)
-        self.dl24_toggle_btn.grid(row=9, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
+        self.dl24_toggle_btn.grid(row=11, column=0, padx=5, pady=5, sticky="ew")
+        # DCIR pulses to the current in the entry above, see DCIRTest
+        self.dcir_btn = ttk.Button(root, text="DCIR", command=self.run_dcir)
+        self.dcir_btn.grid(row=11, column=1, padx=5, pady=5, sticky="ew")
     
-        ttk.Button(root, text="Reset DL24", command=self.reset_dl24).grid(row=9, column=2, padx=5, pady=5, sticky="ew")
+        ttk.Button(root, text="Reset DL24", command=self.reset_dl24).grid(row=11, column=2, padx=5, pady=5, sticky="ew")
         
-        ttk.Button(root, text="Read DL24", command=self.read_dl24).grid(row=10, column=0, columnspan=3, padx=5, pady=5, sticky="ew")
+        ttk.Button(root, text="Read DL24", command=self.read_dl24).grid(row=12, column=0, padx=5, pady=5, sticky="ew")
+        self.profile_btn = ttk.Button(root, text="Profile...", command=self.run_profile)
+        self.profile_btn.grid(row=12, column=1, padx=5, pady=5, sticky="ew")
+        ttk.Button(root, text="View log", command=self.view_log).grid(row=12, column=2, padx=5, pady=5, sticky="ew")
         
         self.dl24_status = ttk.Label(root, text="DL24 Status: Awaiting input")
-        self.dl24_status.grid(row=11, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
+        self.dl24_status.grid(row=13, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
         
-        self.root.columnconfigure(1, weight=1)
+        # Hot-path timings, see Metrics
+        self.perf_var = tk.StringVar(root, value="")
+        ttk.Label(root, textvariable=self.perf_var, font=("Courier", 8)).grid(row=15, column=0, columnspan=3,
+                                                                             padx=10, sticky="w")
+        # Streaming statistics and time to cutoff, see LiveStats
+        self.stats_var = tk.StringVar(root, value="")
+        ttk.Label(root, textvariable=self.stats_var, font=("Courier", 8)).grid(row=16, column=0, columnspan=3,
+                                                                              padx=10, sticky="w")
         
-        # Initialize the queue to store data from the data collection thread
-        self.data_queue = queue.Queue()
-        self.pending_set_actions = []
-        time.sleep(0.5)
-        self.update_dl24_settings()
+        self.root.columnconfigure(1, weight=1)
         
         # Data collection attributes
-        self.csvfile = None
-        self.wr = None
         self.collecting_data = False
-        self.data_collection_thread = None
-        self.last_monotonic = None
-        
-        # Plotting by default
-        
-        self.fig = Figure(figsize=(8.5, 7))
-        self.ax1 = self.fig.add_subplot(111)
-        self.ax2 = self.ax1.twinx()
-        self.ax3 = self.ax1.twinx()
-        self.ax4 = self.ax1.twinx()
-        
-        # Move the tick labels of ax3 to the left of its own spine
-        self.ax3.yaxis.tick_left()
-        self.ax3.yaxis.set_label_position("left")
-        self.ax3.tick_params(axis='y', which='both', direction='out', colors='blue')
-        self.ax3.spines["left"].set_position(("axes", 1.0))
-        
-        self.ax4.spines["right"].set_position(("axes", 0.00))
-        self.ax4.tick_params(axis='y', which='both', direction='out', colors='orange')
-        
-        self.fig.set_size_inches(8.5, 7)
-        self.canvas = FigureCanvasTkAgg(self.fig, master=self.root)
-        self.canvas_widget = self.canvas.get_tk_widget()
-        self.canvas_widget.grid(row=12, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
-        
-        # -- Create empty Line2D objects & store references --
-        (self.line_voltage,) = self.ax1.plot([], [], color='green', label='Voltage')
-        (self.line_current,) = self.ax2.plot([], [], color='red',   label='Current')
-        (self.line_charge,)  = self.ax3.plot([], [], color='blue',  linestyle='--', label='Charge')
-        (self.line_energy,)  = self.ax4.plot([], [], color='orange',linestyle='-.', label='Energy')
-        
-        # Format the axes once
-        self.ax1.set_ylabel("Voltage (V)", color='green')
-        self.ax2.set_ylabel("Current (A)", color='red')
-        self.ax3.set_ylabel("Charge (mAh)", color='blue')
-        self.ax4.set_ylabel("Energy (Wh)", color='orange')
-        
-        # Y-axis format
-        self.ax1.yaxis.set_major_formatter(FormatStrFormatter('%g V'))
-        self.ax2.yaxis.set_major_formatter(FormatStrFormatter('%g A'))
-        self.ax3.yaxis.set_major_formatter(FormatStrFormatter('%g mAh'))
-        self.ax4.yaxis.set_major_formatter(FormatStrFormatter('%g Wh'))
+        self.async_engine = None
+        # CSV durability policy, see CsvLog
+        self.flush_rows = 20
+        self.flush_seconds = 1.0
+        # Rendering policy: at most max_fps redraws per second, and no Tk
+        # callback spends more than drain_budget seconds emptying the queues
+        self.max_fps = 5
+        self.drain_budget = 0.02
+        self.drain_chunk = 500
+        self.perf_path = None  # metrics JSON, default next to the output
+        self.resume_rows = 5000  # records read back from the log on Resume
+        self.event_log = None
+        # DCIR pulses: base current (0 = off), sampling window before and
+        # after the step, settling time, pulse interval and count (None =
+        # until cutoff)
+        self.dcir_low = 0.0
+        self.dcir_window = 1.0
+        self.dcir_settle = 0.1
+        self.dcir_interval = 60.0
+        self.dcir_count = None
+        self.dcir_log = None
+        self.burst_seconds = 5.0  # length of a burst capture
+        self.next_frame = 0.0
+        self.frames = 0
+        self.frames_skipped = 0
         
-        # Gather lines from each axes to create combined legend once
-        lines1, labels1 = self.ax1.get_legend_handles_labels()
-        lines2, labels2 = self.ax2.get_legend_handles_labels()
-        lines3, labels3 = self.ax3.get_legend_handles_labels()
-        lines4, labels4 = self.ax4.get_legend_handles_labels()
-        self.ax1.legend(lines1 + lines2 + lines3 + lines4,
-                        labels1 + labels2 + labels3 + labels4,
-                        loc='best')
+        # Plotting by default, one tab per device
+        self.notebook = ttk.Notebook(self.root)
+        self.notebook.grid(row=14, column=0, columnspan=3, padx=10, pady=10, sticky="ew")
         
-        # Force initial draw
-        self.canvas.draw()
+        # Creates the devices, each with its own I/O worker thread
+        self.set_ports()
+        self.root.after(50, self.process_ui_calls)
         
 
         # Additional attributes for handling "set" actions for DL24
         
         print("App initialized.")
+    
+    def device(self):
+        """The device selected for commands."""
+        return self.devices.get(self.device_var.get()) or next(iter(self.devices.values()))
+    
+    def set_ports(self):
+        if self.collecting_data:
+            print("Stop data collection before changing ports")
+            return
+        ports = [port.strip() for port in self.ports_var.get().split(",") if port.strip()]
+        if not ports:
+            ports = [COM_Port]
+        period = self._period()
+        for port in list(self.devices):
+            if port not in ports:
+                self.devices.pop(port).close()
+                self.plots.pop(port)
+                self.notebook.forget(self.tabs.pop(port))
+        for port in ports:
+            if port not in self.devices:
+                self.devices[port] = DL24Device(port, period)
+                frame = ttk.Frame(self.notebook)
+                self.plots[port] = PlotPanel(frame, blit=True)
+                self.plots[port].canvas_widget.grid(row=0, column=0, sticky="ew")
+                self.notebook.add(frame, text=port)
+                self.tabs[port] = frame
+        self.ports_var.set(", ".join(ports))
+        self.device_box["values"] = ports
+        if self.device_var.get() not in ports:
+            self.device_var.set(ports[0])
+        self.select_device()
+    
+    def select_device(self):
+        device = self.device()
+        self.dl24_toggle_btn["text"] = "Disable DL24" if device.enabled else "Enable DL24"
+        self.profile_btn["text"] = "Stop profile" if device.sequence and device.sequence.running else "Profile..."
+        self.dcir_btn["text"] = "Stop DCIR" if device.dcir and device.dcir.running else "DCIR"
+        self.notebook.select(self.tabs[device.port])
+        self.update_dl24_settings()
         
     def toggle_dl24(self):
-        if self.dl24_button_state:
-            self._with_dl24(self._disable)
-            self.dl24_toggle_btn["text"] = "Enable DL24"
-            self.dl24_button_state = False
+        device = self.device()
+        if device.enabled:
+            def done(result):
+                device.enabled = False
+                self._sync_log(device)
+                self.select_device()
+            # Switching the load off goes ahead of everything else
+            self._with_dl24(self._disable, DL24Worker.PRIORITY_SAFETY, done)
         else:
-            self._with_dl24(self._enable)
-            self.dl24_toggle_btn["text"] = "Disable DL24"
-            self.dl24_button_state = True
+            def done(result):
+                device.enabled = True
+                self._sync_log(device)
+                self.select_device()
+            self._with_dl24(self._enable, on_done=done)
         
     def browse_output(self):
-        path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
+        path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv"),
+                                                                                ("DL24 binary log", "*.dl24")])
         if path:
             self.output_var.set(path)
         
@@ -187,207 +2798,259 @@ class App:
         else:
             self.collecting_data = True
             self.start_btn["text"] = "Stop"
-            self.data_collection_thread = threading.Thread(target=self.collect_data)
-            self.data_collection_thread.start()  # Starting data collection in a new thread
+            self._start_sampling()
             self.root.after(1000, self.check_data_queue)  # Start checking the data queue
     
+    def _period(self):
+        try:
+            return max(float(self.period_var.get()), DeadlineScheduler.MIN_PERIOD)
+        except ValueError:
+            print(f"Invalid sample period: {self.period_var.get()!r}")
+            return 0.5
+    
+    def set_sample_period(self):
+        period = self._period()
+        for device in self.devices.values():
+            device.worker.set_period(period)
+        self.period_var.set(f"{period:g}")
+    
     def start_data_collection(self):
         if not self.collecting_data:
             self.collecting_data = True
             self.start_btn["state"] = tk.DISABLED
-            self.data_queue = queue.Queue()
-            self.data_collection_thread = threading.Thread(target=self.collect_data)
-            self.data_collection_thread.start()
+            self._start_sampling()
             self.root.after(1000, self.check_data_queue)
         else:
             self.start_btn["state"] = tk.NORMAL
             self.collecting_data = False
     
-    def stop_data_collection(self):
-        self.collecting_data = False
-        if self.csvfile:
-            self.csvfile.close()
-            self.csvfile = None
-            self.wr = None
-        # Join the thread to ensure it stops cleanly
-        self.data_collection_thread.join()
+    def _start_sampling(self):
+        # Tk variables are read here, the worker threads must not touch them
+        self.set_sample_period()
+        METRICS.reset()
+        out_path, combined = self.output_var.get(), self.combined_var.get()
+        # Resume continues the log, so it implies Append
+        resume = self.resume_var.get() and bool(out_path)
+        try:
+            logs = output_logs(out_path, self.append_var.get() or resume, combined, list(self.devices),
+                               flush_rows=self.flush_rows, flush_seconds=self.flush_seconds)
+            if resume:
+                paths = log_paths(out_path, combined, list(self.devices))
+                try:
+                    for port, device in self.devices.items():
+                        self._resume(device, self.plots[port], paths[port], port if combined else None)
+                except (OSError, ValueError):
+                    # Nothing was written yet; the logs' writer threads end
+                    for log in set(logs.values()):
+                        if log:
+                            log.close()
+                    raise
+        except (OSError, ValueError) as e:
+            print(f"Error while opening the output: {e}")
+            self.dl24_status["text"] = f"Not started: {e}"
+            self.collecting_data = False
+            self.start_btn["text"] = "Start"
+            self.start_btn["state"] = tk.NORMAL
+            return
+        for log in set(logs.values()):
+            if log:
+                log.on_error = functools.partial(self._on_log_error, log)
+        # All devices sample on the same deadline grid
+        start = time.monotonic()
+        for port, device in self.devices.items():
+            device.data_queue = SampleBuffer()
+            device.stats.reset()
+            device.log = logs[port]
+            if self.async_var.get():
+                if self.async_engine is None:
+                    self.async_engine = AsyncEngine()
+                if device.async_session is None:
+                    # Shares the port handle (and its lock) with the command worker
+                    device.async_session = AsyncDL24Session(device.session)
+                sinks = [AsyncPlotSink(functools.partial(self._on_batch, device))]
+                if device.log:
+                    sinks.append(AsyncCsvSink(device.log, port))
+                device.async_run = self.async_engine.start(device.async_session, device.scheduler, sinks,
+                                                           functools.partial(self._on_sample_error, device),
+                                                           start)
+                continue
+            if device.log:
+                device.log.attach()
+            device.scheduler.reset(start)
+            device.worker.start_sampling(functools.partial(self.collect_data, device),
+                                         functools.partial(self._on_sample_error, device))
     
-    def collect_data(self):
+    def _resume(self, device, plot, path, port):
         """
-        Background thread function: continuously reads *device* voltage/current/
-        temp/energy/charge, then puts them into self.data_queue for the main
-        thread to (1) do local integration and (2) update plots.
-        Also writes device data to the CSV file.
+        Seeds the plot and the integrator from the end of an existing log,
+        as if those records had just been sampled.
         """
-        while self.collecting_data:
-            with self.com_port_lock:
-                try:
-                    with DL24(COM_Port) as dl24:
-                        voltage = dl24.get_voltage()
-                        current = dl24.get_current()
-                        temp = dl24.get_temp()
-                        device_energy = dl24.get_energy()   # Device-reported Wh
-                        device_charge = dl24.get_charge()   # Device-reported mAh (or Ah, depending on your dl24.py)
-                        on_time = dl24.get_time()
-    
-                        # Timestamp for local logging
-                        t = datetime.datetime.now()
-    
-                        # Simple local power calculation
-                        power = voltage * current
-    
-                        # Enqueue raw data so the main thread can integrate & plot
-                        # (t, voltage, current, device_energy, device_charge, temp)
-                        self.data_queue.put((t, voltage, current, device_energy, device_charge, temp))
-    
-                except Exception as e:
-                    print(f"Error while collecting data: {e}")
-                    # Maybe wait a bit longer so it doesn't spam at 0.5 s
-                    time.sleep(2.0)
-                    continue
-    
-            # -----------------
-            # CSV writing logic
-            # -----------------
-            out_path = self.output_var.get()
-            if out_path:
-                exists = os.path.exists(out_path)
-                if self.csvfile is None:
-                    if self.append_var.get() and exists:
-                        self.csvfile = open(out_path, 'a', newline='')
-                    else:
-                        self.csvfile = open(out_path, 'w', newline='')
-                    self.wr = csv.writer(self.csvfile)
-                    # CSV header: renamed columns to reflect these are device counters
-                    self.wr.writerow([
-                        'date', 'voltage', 'current', 'Power',
-                        'device_energy', 'device_charge', 'temp',
-                        'time_seconds', 'time_str'
-                    ])
-    
-                if self.wr:
-                    days = on_time.days
-                    seconds = on_time.seconds
-                    hours = seconds // 3600
-                    minutes = (seconds // 60) % 60
-                    seconds = seconds % 60
-                    time_sec = int(on_time.total_seconds())
-                    time_str = f"{days:01d}d. {hours:02d}:{minutes:02d}:{seconds:02d}"
-    
-                    data = [
-                        t.strftime("%Y-%m-%d %H:%M:%S"),
-                        f"{voltage:.3f}",
-                        f"{current:.3f}",
-                        f"{power:.2f}",
-                        f"{device_energy:.3f}",   # device-reported Wh
-                        f"{device_charge:.1f}",   # device-reported mAh
-                        f"{temp:.0f}",
-                        f"{time_sec}",
-                        time_str,
-                    ]
-                    self.wr.writerow(data)
-                    self.csvfile.flush()
-    
-            # Sleep for ~0.5 s between reads
-            time.sleep(0.5)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        t0 = time.perf_counter()
+        snaps = read_log_tail(path, self.resume_rows, port)
+        plot.clear()
+        device.integrator.reset()
+        if not snaps:
+            return
+        last = snaps[-1]
+        plot.series.extend(date=mdates.date2num([snap.t for snap in snaps]),
+                           voltage=[snap.voltage for snap in snaps], current=[snap.current for snap in snaps],
+                           charge=[snap.charge for snap in snaps], energy=[snap.energy for snap in snaps])
+        device.integrator.resume(last.charge, last.energy)
+        plot.dirty = True
+        print(f"Resumed {device.port} from {path}: {len(snaps)} record(s) up to {last.t}, "
+              f"{last.charge:.1f} mAh, {last.energy:.3f} Wh ({(time.perf_counter() - t0) * 1000:.1f} ms)")
+    
+    def _on_batch(self, device, batch):
+        # Called on the asyncio thread by AsyncPlotSink
+        device.data_queue.put(batch)
+        if device.sequence:
+            for snap in batch:
+                device.sequence.on_sample(snap)
+    
+    def stop_data_collection(self):
+        self.collecting_data = False
+        for device in self.devices.values():
+            if device.async_run is not None:
+                # Cancelling the sampler lets the sinks flush and close
+                self.async_engine.stop(device.async_run)
+                device.async_run = None
+            else:
+                # The CSV is released once the sample in progress (if any) has been written
+                device.worker.stop_sampling(device.log.detach if device.log else None)
+            print(device.scheduler.report())
+            print(device.session.report())
+            print(f"{device.port}: {device.integrator.report()}")
+            print(f"{device.port}: {device.data_queue.report()}")
+            print("\n".join(f"{device.port}: {line}" for line in device.stats.summary().split("\n")))
+        print(f"GUI: {self.frames} frame(s) drawn, {self.frames_skipped} skipped (no new data or not visible)")
+        print(METRICS.summary())
+        path = metrics_path(self.output_var.get(), self.perf_path)
+        if path:
+            METRICS.save(path)
+    
+    def _on_sample_error(self, device, e):
+        print(f"Error while collecting data from {device.port}: {str(e) or type(e).__name__}")
+        self._sync_log(device)
+    
+    def _on_log_error(self, log, e):
+        # Called on the log's writer thread; the status line is set on the Tk thread
+        def done(result):
+            self.dl24_status["text"] = f"Logging stopped, {log.path}: {e}"
+        
+        future = Future()
+        future.set_result(None)
+        self.ui_calls.put((future, done))
     
+    def _sync_log(self, device):
+        # Get everything logged so far onto the disk around important events
+        if self.collecting_data and device.log:
+            device.log.sync()
     
+    def collect_data(self, device, snap):
+        """
+        Called on a device's worker thread at every sampling deadline with the
+        device's voltage/current/temp/energy/charge snapshot. Puts it into
+        device.data_queue for the main thread to (1) do local integration and
+        (2) update plots, and writes the device data to the CSV file.
+        """
+        # Hand the snapshot to the main thread to integrate & plot
+        device.data_queue.put((snap,))
+        if device.sequence:
+            device.sequence.on_sample(snap)
+
+        # -----------------
+        # CSV writing logic
+        # -----------------
+        if device.log:
+            device.log.add(snap, device.port)
+
+
     def check_data_queue(self):
         """
-        Pulls all available data from self.data_queue, updates local time-series
-        arrays (date_series, voltage_series, current_series, etc.), computes local
-        integrated charge/energy (after the first sample), and compares them to
-        the device counters. Prints a warning if difference exceeds 1%.
+        Pulls the available data from every device's data_queue, integrates
+        charge/energy locally (see Integrator, which also keeps the comparison
+        with the device counters) and appends everything to the device's
+        time-series store (date, voltage, current, charge, energy).
+        
+        Each device gets an equal share of drain_budget; whatever does not
+        fit is picked up by an immediate follow-up callback, so a burst of
+        samples never blocks the UI for long. Plots are redrawn at most
+        max_fps times a second, and only those with new data that can be
+        seen (not on a hidden tab, window not iconified).
         """
-    
-        # First, handle any pending "set" actions
-        for action in self.pending_set_actions:
-            action()
-        self.pending_set_actions.clear()
-    
-        try:
-            # Drain the queue of all data points that arrived since last call
-            while True:
-                # The background thread enqueues: (t, V, I, devEnergy, devCharge, temp)
-                t, voltage, current, device_energy, device_charge, temp = self.data_queue.get_nowait()
-    
-                # Local power calculation
-                power = voltage * current
-    
-                if len(self.date_series) == 0:
-                    #
-                    # -- FIRST DATA POINT: Use device counters directly --
-                    #
-                    self.date_series.append(t)
-                    self.voltage_series.append(voltage)
-                    self.current_series.append(current)
-    
-                    # Start the local arrays from device’s reported counters:
-                    self.energy_series.append(device_energy)   # Wh
-                    self.charge_series.append(device_charge)   # mAh
-                else:
-                    #
-                    # -- SUBSEQUENT DATA POINTS: local integration from prior local values --
-                    #
-                    now_monotonic = time.monotonic()
-                    if self.last_monotonic is None:
-                        # First data point: no previous time
-                        dt = 0.0
-                    else:
-                        dt = now_monotonic - self.last_monotonic
-                    self.last_monotonic = now_monotonic
-                    
-                    
-                    self.date_series.append(t)
-                    self.voltage_series.append(voltage)
-                    self.current_series.append(current)
-    
-                    # Local integrated totals
-                    local_charge = self.charge_series[-1] + (current * dt) / 3.6
-                    local_energy = self.energy_series[-1] + (power * dt) / 3600.0
-    
-                    self.charge_series.append(local_charge)
-                    self.energy_series.append(local_energy)
-    
-                    #
-                    # -- Compare local vs. device counters -> warn if >1% difference --
-                    #
-                    # If device_charge is in mAh, we compare directly
-                    if device_charge > 0.01:
-                        err_charge_pct = abs(local_charge - device_charge) / device_charge * 100.0
-                        if err_charge_pct > 1.0:
-                            print(
-                                f"Warning: local charge differs from device by {err_charge_pct:.2f}% "
-                                f"(local={local_charge:.1f} mAh, device={device_charge:.1f} mAh)"
-                            )
-    
-                    if device_energy > 0.0001:
-                        err_energy_pct = abs(local_energy - device_energy) / device_energy * 100.0
-                        if err_energy_pct > 1.0:
-                            print(
-                                f"Warning: local energy differs from device by {err_energy_pct:.2f}% "
-                                f"(local={local_energy:.3f} Wh, device={device_energy:.3f} Wh)"
-                            )
-    
-                #
-                # -- Print data line to console (show local integrated totals) --
-                #
-                time_str = t.strftime("%Y.%m.%d %H:%M:%S.%f")[:-4]  # discard last digits of microseconds
-                data_str = (
-                    f"{time_str} | {voltage:6.03f} V | {current:6.3f} A "
-                    f"| {power:6.2f} W | {self.energy_series[-1]:6.3f} Wh "
-                    f"| {self.charge_series[-1]:7.1f} mAh | {temp:4.1f} °C"
-                )
-                print(data_str)
-    
-        except queue.Empty:
-            # No more items in the queue
-            pass
+        budget = self.drain_budget / max(len(self.devices), 1)
+        pending = False
+        t0 = time.perf_counter()
+        for port, device in self.devices.items():
+            METRICS.add_depth("display queue", len(device.data_queue))
+            if self._drain_device(device, self.plots[port], time.perf_counter() + budget):
+                pending = True
+        METRICS.add_time("drain", time.perf_counter() - t0)
         
-        self.update_plot()
+        now = time.perf_counter()
+        if now >= self.next_frame:
+            self.next_frame = now + 1.0 / max(self.max_fps, 0.1)
+            self.rate_var.set("\n".join(f"{port}: {device.scheduler.report()}\n"
+                                        f"{port}: {device.integrator.report()}\n"
+                                        f"{port}: {device.data_queue.report()}"
+                                        for port, device in self.devices.items()))
+            if self.update_plot():
+                self.frames += 1
+            else:
+                self.frames_skipped += 1
+            self.perf_var.set(METRICS.summary())
+            self.stats_var.set("\n".join(f"{port}: {line}" for port, device in self.devices.items()
+                                         for line in device.stats.summary().split("\n")))
         # Reschedule check_data_queue if still collecting data
         if self.collecting_data:
-            self.root.after(400, self.check_data_queue)
+            if pending:
+                self.root.after(1, self.check_data_queue)
+            else:
+                wait = self.next_frame - time.perf_counter()
+                self.root.after(max(int(wait * 1000), 1), self.check_data_queue)
+    
+    def _drain_device(self, device, plot, deadline):
+        """
+        Returns True if the deadline (time.perf_counter()) ran out with
+        samples still queued.
+        """
+        # Take the data points that arrived since last call, in chunks
+        while time.perf_counter() < deadline:
+            # The device's worker publishes Snapshot records
+            batch = device.data_queue.take(self.drain_chunk)
+            if not batch:
+                return False
+            self._process_batch(device, plot, batch)
+        return len(device.data_queue) > 0
+    
+    def _process_batch(self, device, plot, batch):
+        prefix = f"{device.port} | " if len(self.devices) > 1 else ""
+        voltage = np.array([snap.voltage for snap in batch])
+        current = np.array([snap.current for snap in batch])
+        # Local integrated totals, from the time each sample was read
+        charge, energy = device.integrator.add(np.array([snap.mono for snap in batch]), voltage, current,
+                                               np.array([snap.charge for snap in batch]),
+                                               np.array([snap.energy for snap in batch]))
+        plot.series.extend(date=mdates.date2num([snap.t for snap in batch]), voltage=voltage,
+                           current=current, charge=charge, energy=energy)
+        plot.dirty = True
+        for snap in batch:
+            device.stats.add(snap.mono, snap.voltage, snap.current, snap.temp)
+        
+        #
+        # -- Print data lines to console (show local integrated totals) --
+        #
+        lines = []
+        for snap, local_charge, local_energy in zip(batch, charge, energy):
+            time_str = snap.t.strftime("%Y.%m.%d %H:%M:%S.%f")[:-4]  # discard last digits of microseconds
+            lines.append(
+                f"{prefix}{time_str} | {snap.voltage:6.03f} V | {snap.current:6.3f} A "
+                f"| {snap.power:6.2f} W | {local_energy:6.3f} Wh "
+                f"| {local_charge:7.1f} mAh | {snap.temp:4.1f} °C"
+            )
+        print("\n".join(lines))
     
         
     
@@ -396,26 +3059,19 @@ class App:
     def set_dl24_current(self):
         value = float(self.current_entry.get())
         
-        def operation(dl24):
-            try:
-                self._set_current(dl24, value)
-                # The after() method in tkinter schedules a function to be run in the main thread. 
-                # By using a delay of 0, it means the function will be scheduled to run as soon as possible.
-                self.root.after(0, lambda: self.dl24_status.config(text=f"Current set to {value} A"))
-                self.root.after(0, self.update_dl24_settings)
-            except Exception as e:
-                print(f"Error while setting current: {e}")
+        def done(result):
+            self.dl24_status.config(text=f"Current set to {value} A")
+            self.update_dl24_settings()
         
-        self.pending_set_actions.append(lambda: self._with_dl24(operation))
+        self._with_dl24(lambda dl24: self._set_current(dl24, value), on_done=done)
     
     def set_dl24_voltage_cutoff(self):
         value = float(self.voltage_cutoff_entry.get())
-        def operation(dl24):
-            self._set_voltage_cutoff(dl24, value)
-            self.root.after(0, lambda: self.dl24_status.config(text=f"Voltage cutoff set to {value} V"))
-            self.root.after(0, self.update_dl24_settings)
+        def done(result):
+            self.dl24_status.config(text=f"Voltage cutoff set to {value} V")
+            self.update_dl24_settings()
         
-        self.pending_set_actions.append(lambda: self._with_dl24(operation))
+        self._with_dl24(lambda dl24: self._set_voltage_cutoff(dl24, value), on_done=done)
     
     def set_dl24_timer(self):
         value_str = self.timer_entry.get()
@@ -427,70 +3083,208 @@ class App:
             hours, minutes, seconds = map(int, value_str.split(':'))
             value = hours * 3600 + minutes * 60 + seconds
     
-        def operation(dl24):
-            self._set_timer(dl24, value)
-            self.root.after(0, lambda: self.dl24_status.config(text=f"Timer set to {value} seconds"))
-            self.root.after(0, lambda: self.timer_var.set(f"Timer setting: {self.timedelta_to_str(datetime.timedelta(seconds=value))}"))
-            self.root.after(0, self.update_dl24_settings)
+        def done(result):
+            self.dl24_status.config(text=f"Timer set to {value} seconds")
+            self.timer_var.set(f"Timer setting: {self.timedelta_to_str(datetime.timedelta(seconds=value))}")
+            self.update_dl24_settings()
         
-        self.pending_set_actions.append(lambda: self._with_dl24(operation))
+        self._with_dl24(lambda dl24: self._set_timer(dl24, value), on_done=done)
+    
+    def _with_dl24(self, operation, priority=DL24Worker.PRIORITY_COMMAND, on_done=None, device=None):
+        """
+        Queue operation(dl24) on the worker of the selected (or given) device
+        and return immediately. on_done(result) is called on the Tk thread
+        once it has run.
+        """
+        device = device or self.device()
+        future = device.worker.submit(operation, priority)
+        future.add_done_callback(lambda f: self.ui_calls.put((f, on_done)))
+        return future
     
-    def _with_dl24(self, operation):
-        with self.com_port_lock:
+    def process_ui_calls(self):
+        """Finish completed device commands on the Tk thread."""
+        while True:
             try:
-                with DL24(COM_Port) as dl24:
-                    operation(dl24)
-            except Exception as e:
-                print(f"Error while executing operation with DL24: {e}")
+                future, on_done = self.ui_calls.get_nowait()
+            except queue.Empty:
+                break
+            error = future.exception()
+            if error is not None:
+                print(f"Error while executing operation with DL24: {error}")
+                self.dl24_status["text"] = f"DL24 Error: {error}"
+            elif on_done:
+                on_done(future.result())
+        self.root.after(50, self.process_ui_calls)
     
     def update_dl24_settings(self):
+        device = self.device()
         def operation(dl24):
-            current_limit = dl24.get_current_limit()
-            voltage = dl24.get_voltage_cutoff()
-            timer = dl24.get_timer()
+            return dl24.get_current_limit(), dl24.get_voltage_cutoff(), dl24.get_timer()
         
+        def done(result):
+            current_limit, voltage, timer = result
+            device.stats.cutoff = voltage
             self.current_var.set(f"Current setting: {current_limit} A")
             self.voltage_cutoff_var.set(f"Voltage cutoff setting: {voltage} V")
             self.timer_var.set(f"Timer setting: {timer} seconds")
         
-        self._with_dl24(operation)
+        self._with_dl24(operation, DL24Worker.PRIORITY_ROUTINE, done, device)
     
     def enable_dl24(self):
-        def operation(dl24):
-            self._enable(dl24)
+        def done(result):
             self.dl24_status["text"] = "DL24 Enabled"
             
-        self._with_dl24(operation)
+        self._with_dl24(self._enable, on_done=done)
     
     def disable_dl24(self):
-        def operation(dl24):
-            self._disable(dl24)
+        def done(result):
             self.dl24_status["text"] = "DL24 Disabled"
-        self._with_dl24(operation)
+        self._with_dl24(self._disable, DL24Worker.PRIORITY_SAFETY, done)
     
     def reset_dl24(self):
-        def operation(dl24):
-            self._reset_counters(dl24)
+        device = self.device()
+        plot = self.plots[device.port]
+        def done(result):
             self.dl24_status["text"] = "DL24 Counters Reset"
+            self._sync_log(device)
     
-            # Clear the stored data
-            self.date_series.clear()
-            self.voltage_series.clear()
-            self.current_series.clear()
-            self.energy_series.clear()
-            self.charge_series.clear()
-            self.last_monotonic = None
+            # Clear the stored data, integration restarts from the device counters
+            plot.clear()
+            device.integrator.reset()
+            device.stats.reset()
     
             # Update the plot
-            self.update_plot()
+            plot.update()
     
-        self._with_dl24(operation)
+        self._with_dl24(self._reset_counters, DL24Worker.PRIORITY_SAFETY, done)
     
     def read_dl24(self):
-        def operation(dl24):
-            self._read(dl24)
-            
-        self._with_dl24(operation)
+        self._with_dl24(self._read, DL24Worker.PRIORITY_ROUTINE)
+    
+    def run_profile(self, path=None):
+        """
+        Run a load profile (see TestSequence) on the selected device, or stop
+        the one running. Start data collection as well to get cutoff
+        detection and command-to-effect latencies.
+        """
+        device = self.device()
+        if device.sequence is not None and device.sequence.running:
+            device.sequence.stop()
+            return
+        path = path or filedialog.askopenfilename(filetypes=[("Load profiles", "*.json"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            profile = TestSequence.load(path)
+        except (OSError, ValueError) as e:
+            print(f"Error while loading profile: {e}")
+            self.dl24_status["text"] = f"Profile error: {e}"
+            return
+        events_path = event_log_path(self.output_var.get())
+        if events_path and (self.event_log is None or self.event_log.path != events_path):
+            if self.event_log:
+                self.event_log.close()
+            self.event_log = EventLog(events_path)
+        device.sequence = TestSequence(device.worker, profile, functools.partial(self._on_profile_event, device))
+        device.sequence.start()
+        self.profile_btn["text"] = "Stop profile"
+        self.dl24_status["text"] = f"Profile {os.path.basename(path)} started on {device.port}"
+    
+    def _on_profile_event(self, device, event):
+        # Called on the device's worker thread (or the asyncio thread)
+        if self.event_log:
+            self.event_log.add(device.port, event)
+        print(f"{device.port} | profile {event['event']}: {event['step']} {event.get('detail', '')}")
+        
+        def done(result):
+            if event['event'] == 'step':
+                device.enabled = event['target'] > 0
+            elif event['event'] in ('cutoff', 'done', 'stopped'):
+                device.enabled = False
+            self._sync_log(device)
+            self.dl24_status["text"] = f"{device.port} profile: {event['event']} {event['step']}"
+            if device is self.device():
+                self.select_device()
+        
+        # Finish on the Tk thread like a device command
+        future = Future()
+        future.set_result(event)
+        self.ui_calls.put((future, done))
+    
+    def run_dcir(self, high=None):
+        """
+        Start DCIR pulses to `high` A (default: the current entry) on the
+        selected device, or stop the ones running.
+        """
+        device = self.device()
+        if device.dcir is not None and device.dcir.running:
+            device.dcir.stop()
+            self.select_device()
+            return
+        try:
+            high = float(self.current_entry.get()) if high is None else high
+        except ValueError:
+            self.dl24_status["text"] = "DCIR: enter the pulse current first"
+            return
+        path = event_log_path(self.output_var.get(), "dcir")
+        if path and (self.dcir_log is None or self.dcir_log.path != path):
+            if self.dcir_log:
+                self.dcir_log.close()
+            self.dcir_log = DCIRLog(path)
+        device.dcir = DCIRTest(device.worker, high, self.dcir_low, self.dcir_window, self.dcir_settle,
+                               self.dcir_interval, self.dcir_count, functools.partial(self._on_dcir_result, device))
+        device.dcir.start()
+        self.dcir_btn["text"] = "Stop DCIR"
+        self.dl24_status["text"] = f"DCIR {self.dcir_low:g} -> {high:g} A every {device.dcir.interval:g} s on {device.port}"
+    
+    def _on_dcir_result(self, device, result):
+        # Called on the device's worker thread after every pulse
+        if self.dcir_log:
+            self.dcir_log.add(device.port, result)
+        print(f"{device.port} | {DCIRTest.describe(result)}")
+        
+        def done(result):
+            device.enabled = device.dcir.running and device.dcir.low > 0
+            self.dl24_status["text"] = f"{device.port} {DCIRTest.describe(result)}"
+            if device is self.device():
+                self.select_device()
+        
+        future = Future()
+        future.set_result(result)
+        self.ui_calls.put((future, done))
+    
+    def run_burst(self, seconds=None):
+        """
+        Capture V/I as fast as possible for burst_seconds on the selected
+        device (see BurstCapture), saved as "<output> burst <time>.csv".
+        """
+        device = self.device()
+        burst = BurstCapture(seconds or self.burst_seconds)
+        self.dl24_status["text"] = f"Burst capture on {device.port} ..."
+        
+        def done(result):
+            path = event_log_path(self.output_var.get() or "DL24", f"{port_name(device.port)} burst "
+                                  + burst.started[0].strftime("%Y.%m.%d %H-%M-%S"))
+            try:
+                burst.save(path)
+            except OSError as e:
+                print(f"Error while saving burst: {e}")
+                path = "not saved"
+            print(f"{device.port}: {burst.report()} -> {path}")
+            self.dl24_status["text"] = f"{device.port} {burst.report()}"
+        
+        self._with_dl24(burst.capture, on_done=done, device=device)
+    
+    def view_log(self, path=None):
+        path = path or filedialog.askopenfilename(filetypes=[("DL24 logs", "*.csv *.dl24"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            t0 = time.perf_counter()
+            LogViewer(self.root, path)
+            print(f"Log viewer ready in {time.perf_counter() - t0:.2f} s")
+        except Exception as e:
+            print(f"Error while opening {path}: {e}")
     
     def _set_current(self, dl24, value):
         try:
@@ -527,12 +3321,9 @@ class App:
 
     def _read(self, dl24):
         is_on = dl24.get_is_on()
-        voltage = dl24.get_voltage()
-        current = dl24.get_current()
-        energy = dl24.get_energy()
-        charge = dl24.get_charge()
-        time_DL24 = dl24.get_time()
-        temp = dl24.get_temp()
+        snap = read_snapshot(dl24)
+        voltage, current, temp = snap.voltage, snap.current, snap.temp
+        energy, charge, time_DL24 = snap.energy, snap.charge, snap.on_time
         current_limit = dl24.get_current_limit()
         voltage_cutoff = dl24.get_voltage_cutoff()
         timer = dl24.get_timer()
@@ -559,37 +3350,18 @@ class App:
                 
     def update_plot(self):
         """
-        Update the data in the existing line objects without clearing axes.
-        Then refresh the figure.
+        Redraws the plots that have new data and are on screen. Returns True
+        if anything was drawn.
         """
-        # 1) Update each line's data
-        self.line_voltage.set_xdata(self.date_series)
-        self.line_voltage.set_ydata(self.voltage_series)
-        
-        self.line_current.set_xdata(self.date_series)
-        self.line_current.set_ydata(self.current_series)
-
-        self.line_charge.set_xdata(self.date_series)
-        self.line_charge.set_ydata(self.charge_series)
-
-        self.line_energy.set_xdata(self.date_series)
-        self.line_energy.set_ydata(self.energy_series)
-
-        # 2) Update the axis limits so new data points are visible
-        self.ax1.relim()  # Recalculate limits for ax1
-        self.ax1.autoscale_view()
-
-        self.ax2.relim()
-        self.ax2.autoscale_view()
-
-        self.ax3.relim()
-        self.ax3.autoscale_view()
-
-        self.ax4.relim()
-        self.ax4.autoscale_view()
-
-        # 3) Finally, redraw the figure
-        self.canvas.draw_idle()
+        drawn = False
+        for plot in self.plots.values():
+            # Not viewable: hidden notebook tab, or the window is iconified
+            if plot.dirty and plot.canvas_widget.winfo_viewable():
+                t0 = time.perf_counter()
+                plot.update()
+                METRICS.add_time("render", time.perf_counter() - t0)
+                drawn = True
+        return drawn
 
 
 
@@ -602,9 +3374,296 @@ class App:
     def on_closing(self):
         if self.collecting_data:
             self.stop_data_collection()
+        logs = {device.log for device in self.devices.values() if device.log}
+        for device in self.devices.values():
+            device.close()
+        if self.event_log:
+            self.event_log.close()
+        if self.dcir_log:
+            self.dcir_log.close()
+        # Let the CSV writers finish what is still queued
+        for log in logs:
+            log.join(5.0)
+        if self.async_engine is not None:
+            self.async_engine.close()
         self.root.destroy()
 
-root = tk.Tk()
-app = App(root)
-root.mainloop()
+
+def run_gui(args):
+    _import_gui()
+    root = tk.Tk()
+    app = App(root)
+    if args.port:
+        app.ports_var.set(", ".join(args.port))
+        app.set_ports()
+    app.period_var.set(f"{args.period:g}")
+    if args.output:
+        app.output_var.set(args.output)
+    app.append_var.set(args.append)
+    app.resume_var.set(args.resume)
+    app.combined_var.set(args.combined)
+    app.flush_rows = args.flush_rows
+    app.flush_seconds = args.flush_seconds
+    app.max_fps = args.max_fps
+    app.perf_path = args.perf_json
+    if args.view:
+        app.view_log(args.view)
+    if args.profile:
+        app.run_profile(args.profile)
+    app.dcir_low = args.dcir_low
+    app.dcir_window = args.dcir_window
+    app.dcir_interval = args.dcir_interval
+    app.dcir_count = args.dcir_count
+    if args.burst:
+        app.burst_seconds = args.burst
+    if args.dcir is not None:
+        app.run_dcir(args.dcir)
+    root.mainloop()
+
+
+def run_headless(args):
+    """
+    Acquisition without a display: the same devices, scheduler and CSV
+    output as the GUI, set-points taken from the command line.
+    Runs until --duration has passed or Ctrl+C.
+    """
+    ports = args.port or [COM_Port]
+    devices = [DL24Device(port, args.period) for port in ports]
+    try:
+        logs = output_logs(args.output, args.append or args.resume, args.combined, ports,
+                           flush_rows=args.flush_rows, flush_seconds=args.flush_seconds)
+    except (OSError, ValueError) as e:
+        print(f"Error while opening the output: {e}")
+        for device in devices:
+            device.close()
+        return
+    
+    # Apply the set-points before sampling starts
+    commands = []
+    if args.current is not None:
+        commands.append(lambda dl24: dl24.set_current(args.current))
+    if args.cutoff is not None:
+        commands.append(lambda dl24: dl24.set_voltage_cutoff(args.cutoff))
+    if args.timer is not None:
+        commands.append(lambda dl24: dl24.set_timer(datetime.timedelta(seconds=args.timer)))
+    if args.enable:
+        commands.append(lambda dl24: dl24.enable())
+    for device in devices:
+        for command in commands:
+            try:
+                device.worker.submit(command).result()
+            except Exception as e:
+                print(f"Error while configuring {device.port}: {e}")
+        # The cutoff for the time-to-cutoff estimate
+        try:
+            device.stats.cutoff = device.worker.submit(lambda dl24: dl24.get_voltage_cutoff()).result()
+        except Exception as e:
+            print(f"Error while reading the voltage cutoff of {device.port}: {e}")
+    
+    first_sample = threading.Event()
+    print_lock = threading.Lock()
+    prefix = len(devices) > 1
+    
+    def on_sample(device, snap):
+        if device.log:
+            device.log.add(snap, device.port)
+        if device.sequence:
+            device.sequence.on_sample(snap)
+        device.stats.add(snap.mono, snap.voltage, snap.current, snap.temp)
+        with print_lock:
+            if not first_sample.is_set():
+                first_sample.set()
+                print(f"First sample {time.perf_counter() - _STARTED:.3f} s after start")
+            print(console_line(snap, f"{device.port} | " if prefix else ""))
+    
+    def on_error(device, e):
+        print(f"Error while collecting data from {device.port}: {str(e) or type(e).__name__}")
+        if device.log:
+            device.log.sync()
+    
+    # Load profile, run on every device
+    event_log = None
+    
+    def on_event(device, event):
+        if event_log:
+            event_log.add(device.port, event)
+        with print_lock:
+            print(f"{device.port} | profile {event['event']}: {event['step']} {event.get('detail', '')}")
+    
+    if args.profile:
+        try:
+            profile = TestSequence.load(args.profile)
+        except (OSError, ValueError) as e:
+            print(f"Error while loading profile: {e}")
+            profile = None
+        if profile:
+            event_log = EventLog(event_log_path(args.output)) if args.output else None
+            for device in devices:
+                device.sequence = TestSequence(device.worker, profile, functools.partial(on_event, device))
+                device.stats.cutoff = profile.get("cutoff", device.stats.cutoff)
+    
+    # DCIR pulses, on every device
+    dcir_log = DCIRLog(event_log_path(args.output, "dcir")) if args.dcir is not None and args.output else None
+    
+    def on_dcir(device, result):
+        if dcir_log:
+            dcir_log.add(device.port, result)
+        with print_lock:
+            print(f"{device.port} | {DCIRTest.describe(result)}")
+    
+    if args.dcir is not None:
+        for device in devices:
+            device.dcir = DCIRTest(device.worker, args.dcir, args.dcir_low, args.dcir_window, interval=args.dcir_interval,
+                                   count=args.dcir_count, on_result=functools.partial(on_dcir, device))
+    
+    # Burst captures, saved off the worker thread once done
+    savers = []
+    
+    def on_burst(device, future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            print(f"Error while capturing burst on {device.port}: {future.exception()}")
+            return
+        
+        def save():
+            burst = future.result()
+            path = event_log_path(args.output or "DL24", f"{port_name(device.port)} burst "
+                                  + burst.started[0].strftime("%Y.%m.%d %H-%M-%S"))
+            try:
+                burst.save(path)
+            except OSError as e:
+                print(f"Error while saving burst: {e}")
+                path = "not saved"
+            with print_lock:
+                print(f"{device.port}: {burst.report()} -> {path}")
+        
+        saver = threading.Thread(target=save)
+        saver.start()
+        savers.append(saver)
+    
+    def feed_async(device, batch):
+        for snap in batch:
+            if device.sequence:
+                device.sequence.on_sample(snap)
+            device.stats.add(snap.mono, snap.voltage, snap.current, snap.temp)
+    
+    engine = AsyncEngine() if args.engine == "asyncio" else None
+    METRICS.reset()
+    start = time.monotonic()
+    for device in devices:
+        device.log = logs[device.port]
+        if device.sequence:
+            device.sequence.start(start)
+        if device.dcir:
+            device.dcir.start(start)
+        if args.burst:
+            burst = device.worker.submit_at(start + args.burst_at, BurstCapture(args.burst).capture)
+            burst.add_done_callback(functools.partial(on_burst, device))
+        if engine:
+            device.async_session = AsyncDL24Session(device.session)
+            sinks = [AsyncConsoleSink(f"{device.port} | " if prefix else "")]
+            if device.log:
+                sinks.append(AsyncCsvSink(device.log, device.port))
+            sinks.append(AsyncPlotSink(functools.partial(feed_async, device), interval=0.05))
+            device.async_run = engine.start(device.async_session, device.scheduler, sinks,
+                                            functools.partial(on_error, device), start)
+            continue
+        if device.log:
+            device.log.attach()
+        device.scheduler.reset(start)
+        device.worker.start_sampling(functools.partial(on_sample, device), functools.partial(on_error, device))
+    
+    sequences = [job for device in devices for job in (device.sequence, device.dcir) if job]
+    try:
+        # Without --duration a profile or DCIR run ends with the profiles / pulses
+        while args.duration is None or time.monotonic() - start < args.duration:
+            if args.duration is None and sequences and not any(sequence.running for sequence in sequences):
+                break
+            time.sleep(0.2)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for device in devices:
+            if device.async_run is not None:
+                engine.stop(device.async_run)
+            else:
+                device.worker.stop_sampling(device.log.detach if device.log else None)
+            if args.enable:
+                # Only switch off a load this run switched on
+                device.worker.submit(lambda dl24: dl24.disable(), DL24Worker.PRIORITY_SAFETY)
+            device.close()
+            print(device.scheduler.report())
+            print(device.session.report())
+            print("\n".join(f"{device.port}: {line}" for line in device.stats.summary().split("\n")))
+        if engine:
+            engine.close()
+        for log in set(logs.values()):
+            if log:
+                log.join(5.0)
+        if event_log:
+            event_log.close()
+        if dcir_log:
+            dcir_log.close()
+        for saver in savers:
+            saver.join()
+        print(METRICS.summary())
+        path = metrics_path(args.output, args.perf_json)
+        if path:
+            METRICS.save(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DL24 data collection and plotting")
+    parser.add_argument("--headless", action="store_true", help="no GUI, log to CSV and console only")
+    parser.add_argument("--port", action="append", help=f"serial port, repeat for several devices (default {COM_Port})")
+    parser.add_argument("--period", type=float, default=0.5, help="sample period in seconds (default 0.5)")
+    parser.add_argument("--output", help="output CSV, or binary log if it ends in .dl24")
+    parser.add_argument("--append", action="store_true", help="append to an existing output CSV")
+    parser.add_argument("--resume", action="store_true", help="continue an existing output log (GUI: seeds the "
+                                                                  "plot and integration from its last records)")
+    parser.add_argument("--combined", action="store_true", help="one CSV with a port column for all devices")
+    parser.add_argument("--flush-rows", type=int, default=20, help="flush the CSV every N rows (default 20)")
+    parser.add_argument("--flush-seconds", type=float, default=1.0, help="flush the CSV every T seconds (default 1)")
+    parser.add_argument("--max-fps", type=float, default=5, help="maximum plot redraws per second (GUI, default 5)")
+    parser.add_argument("--perf-json", metavar="PATH", help="where to write the performance metrics at the end of a run "
+                                                           "(default: next to the output, .perf.json)")
+    parser.add_argument("--engine", choices=("thread", "asyncio"), default="thread")
+    parser.add_argument("--current", type=float, help="current setting in A")
+    parser.add_argument("--cutoff", type=float, help="voltage cutoff in V")
+    parser.add_argument("--timer", type=float, help="timer in seconds")
+    parser.add_argument("--enable", action="store_true", help="switch the load on (and off again at exit)")
+    parser.add_argument("--profile", metavar="JSON", help="run a load profile (on every device when headless; "
+                                                          "then the run ends with the profile)")
+    parser.add_argument("--dcir", type=float, metavar="AMPS", help="DC internal resistance pulses to this current "
+                                                                   "(results in '<output> dcir.csv')")
+    parser.add_argument("--dcir-low", type=float, default=0.0, help="DCIR base current in A (default 0, load off)")
+    parser.add_argument("--dcir-window", type=float, default=1.0, help="DCIR sampling window before and after "
+                                                                       "the step in s (default 1)")
+    parser.add_argument("--dcir-interval", type=float, default=60.0, help="s between DCIR pulses (default 60)")
+    parser.add_argument("--dcir-count", type=int, help="number of DCIR pulses (default: until cutoff)")
+    parser.add_argument("--burst", type=float, metavar="SECONDS", help="capture V/I as fast as the link allows for "
+                                                                       "this long (headless: once, GUI: Burst button), "
+                                                                       "saved as '<output> burst <time>.csv'")
+    parser.add_argument("--burst-at", type=float, default=0.0, help="headless: start the burst this many s into the run")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds (headless)")
+    parser.add_argument("--view", metavar="LOG", help="open a recorded .csv or .dl24 log in the viewer")
+    parser.add_argument("--export-csv", metavar="LOG", help="convert a .dl24 binary log to CSV (--output or LOG.csv) and exit")
+    args = parser.parse_args(argv)
+    args.period = max(args.period, DeadlineScheduler.MIN_PERIOD)
+    if args.port:
+        args.port = [port.strip() for arg in args.port for port in arg.split(",") if port.strip()]
+    if args.export_csv:
+        out_path = args.output or os.path.splitext(args.export_csv)[0] + ".csv"
+        t0 = time.perf_counter()
+        rows = binlog_to_csv(args.export_csv, out_path)
+        print(f"Exported {rows} records to {out_path} in {time.perf_counter() - t0:.2f} s")
+    elif args.headless:
+        run_headless(args)
+    else:
+        run_gui(args)
+
+
+if __name__ == "__main__":
+    main()
 
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+DL24 emulator on a Linux pseudo-terminal, for load-testing the polling
+loop and reproducing timing problems without a bench.
+
+Serves the PX-100 style serial protocol of the DL24 (what the dl24 library
+talks to the device): 6 byte requests B1 B2 <cmd> <d1> <d2> B6, answered by
+CA CB <d1> <d2> <d3> CE CF for readings or a single 6F for settings. On the
+input sits a simple battery: open-circuit voltage over state of charge,
+sagging by I * R under load; the load switches off at the voltage cutoff
+or when the timer expires, like the real one.
+
+The frames follow the PX-100 protocol description. These scalings are
+checked against the dl24 library by tests/test_emulator.py, a round trip
+through the pty (set current, cutoff and timer, read them back, then
+V, I, mAh, Wh, time and temperature against the emulator's own state);
+the test is skipped where the library is not installed:
+  voltage, current      24 bit readings in mV / mA
+  charge                raw mAh
+  energy                Wh * 1000 (mWh)
+  temperature           raw °C
+  time, timer readings  hours, minutes, seconds in d1 d2 d3
+  set_current, set_voltage_cutoff
+                        integer part in d1, hundredths in d2; the current
+                        limit and cutoff readings answer the same way
+  set_timer             hours in d1, minutes in d2
+
+python "DL24 emulator.py" --latency 0.02 --jitter 0.01 --drop 0.01 --link /tmp/ttyDL24
+python "DL24 electronic load V0.5.py" --port /tmp/ttyDL24
+(or set COM_Port to the printed /dev/pts/N)
+"""
+
+import os
+import tty
+import time
+import random
+import select
+import argparse
+import threading
+
+
+REQUEST_START = b"\xb1\xb2"
+REQUEST_END = 0xB6
+REQUEST_SIZE = 6
+ACK = b"\x6f"
+
+# Requests
+CMD_ON_OFF = 0x01
+CMD_SET_CURRENT = 0x02
+CMD_SET_CUTOFF = 0x03
+CMD_SET_TIMER = 0x04
+CMD_RESET = 0x05
+CMD_IS_ON = 0x10
+CMD_VOLTAGE = 0x11
+CMD_CURRENT = 0x12
+CMD_TIME = 0x13
+CMD_CHARGE = 0x14
+CMD_ENERGY = 0x15
+CMD_TEMP = 0x16
+CMD_CURRENT_LIMIT = 0x17
+CMD_CUTOFF = 0x18
+CMD_TIMER = 0x19
+
+
+def reading(value):
+    """Reply frame for a 24 bit reading."""
+    value = min(max(int(round(value)), 0), 0xFFFFFF)
+    return bytes((0xCA, 0xCB, value >> 16 & 0xFF, value >> 8 & 0xFF, value & 0xFF, 0xCE, 0xCF))
+
+
+def hms(seconds):
+    """Reply frame for a time: hours, minutes, seconds."""
+    seconds = int(seconds)
+    return bytes((0xCA, 0xCB, min(seconds // 3600, 0xFF), seconds // 60 % 60, seconds % 60, 0xCE, 0xCF))
+
+
+def setting(d1, d2):
+    """Set-point sent as integer part and hundredths."""
+    return d1 + d2 / 100.0
+
+
+class Battery:
+    """
+    Open-circuit voltage interpolated over the state of charge, terminal
+    voltage OCV - I * R.
+    """
+    OCV = ((0.0, 3.0), (0.05, 3.3), (0.1, 3.5), (0.3, 3.65), (0.6, 3.85), (0.9, 4.05), (1.0, 4.2))
+
+    def __init__(self, capacity_mah=2000.0, resistance=0.08, soc=1.0):
+        self.capacity_mah = capacity_mah
+        self.resistance = resistance
+        self.soc = soc
+
+    def ocv(self):
+        for (soc0, v0), (soc1, v1) in zip(self.OCV, self.OCV[1:]):
+            if self.soc <= soc1:
+                return v0 + (v1 - v0) * (self.soc - soc0) / (soc1 - soc0)
+        return self.OCV[-1][1]
+
+    def voltage(self, current):
+        return max(self.ocv() - current * self.resistance, 0.0)
+
+    def discharge(self, current, dt):
+        self.soc = max(self.soc - current * dt / 3.6 / self.capacity_mah, 0.0)
+
+
+class EmulatedLoad:
+    """
+    The DL24's state: set-points, on/off, counters and heat sink temperature,
+    advanced in (optionally accelerated) real time whenever it is asked.
+    """
+    AMBIENT = 25.0
+    HEATING = 1.5       # °C per W at steady state
+    TIME_CONSTANT = 60  # s
+
+    def __init__(self, battery, speed=1.0):
+        self.battery = battery
+        self.speed = speed
+        self.on = False
+        self.current_limit = 1.0
+        self.cutoff = 0.0
+        self.timer = 0          # s, 0 = no timer
+        self.charge = 0.0       # mAh
+        self.energy = 0.0       # Wh
+        self.seconds = 0.0
+        self.temp = self.AMBIENT
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def current(self):
+        return self.current_limit if self.on and self.battery.soc > 0 else 0.0
+
+    @property
+    def voltage(self):
+        return self.battery.voltage(self.current)
+
+    def advance(self):
+        now = time.monotonic()
+        remaining = (now - self.last) * self.speed
+        self.last = now
+        while remaining > 0:
+            dt = min(remaining, 1.0)
+            remaining -= dt
+            current = self.current
+            voltage = self.battery.voltage(current)
+            if self.on and voltage <= self.cutoff:
+                self.on = False
+                current, voltage = 0.0, self.battery.voltage(0.0)
+            power = voltage * current
+            self.battery.discharge(current, dt)
+            self.charge += current * dt / 3.6
+            self.energy += power * dt / 3600.0
+            if self.on:
+                self.seconds += dt
+                if self.timer and self.seconds >= self.timer:
+                    self.on = False
+            target = self.AMBIENT + self.HEATING * power
+            self.temp += (target - self.temp) * min(dt / self.TIME_CONSTANT, 1.0)
+
+    def handle(self, cmd, d1, d2):
+        """Reply bytes for one request, None for unknown commands."""
+        with self.lock:
+            self.advance()
+            if cmd == CMD_ON_OFF:
+                self.on = bool(d1)
+                self.advance()  # switches straight off again below the cutoff
+                return ACK
+            if cmd == CMD_SET_CURRENT:
+                self.current_limit = setting(d1, d2)
+                return ACK
+            if cmd == CMD_SET_CUTOFF:
+                self.cutoff = setting(d1, d2)
+                return ACK
+            if cmd == CMD_SET_TIMER:
+                self.timer = d1 * 3600 + d2 * 60
+                return ACK
+            if cmd == CMD_RESET:
+                self.charge = self.energy = self.seconds = 0.0
+                return ACK
+            if cmd == CMD_IS_ON:
+                return reading(self.on)
+            if cmd == CMD_VOLTAGE:
+                return reading(self.voltage * 1000)
+            if cmd == CMD_CURRENT:
+                return reading(self.current * 1000)
+            if cmd == CMD_TIME:
+                return hms(self.seconds)
+            if cmd == CMD_CHARGE:
+                return reading(self.charge)
+            if cmd == CMD_ENERGY:
+                return reading(self.energy * 1000)
+            if cmd == CMD_TEMP:
+                return reading(self.temp)
+            if cmd == CMD_CURRENT_LIMIT:
+                return bytes((0xCA, 0xCB, int(self.current_limit), int(round(self.current_limit * 100)) % 100,
+                              0, 0xCE, 0xCF))
+            if cmd == CMD_CUTOFF:
+                return bytes((0xCA, 0xCB, int(self.cutoff), int(round(self.cutoff * 100)) % 100, 0, 0xCE, 0xCF))
+            if cmd == CMD_TIMER:
+                return hms(self.timer)
+            return None
+
+    def status(self):
+        with self.lock:
+            self.advance()
+            return (f"{'ON ' if self.on else 'OFF'} {self.voltage:6.3f} V {self.current:6.3f} A "
+                    f"{self.charge:8.1f} mAh {self.energy:7.3f} Wh {self.temp:5.1f} °C "
+                    f"SoC {self.battery.soc * 100:5.1f} %")
+
+
+class PtyServer(threading.Thread):
+    """
+    Serves one EmulatedLoad on a new pty. Replies are delayed by latency plus
+    uniform jitter, and a fraction `drop` of them is never sent.
+    """
+    def __init__(self, load, latency=0.0, jitter=0.0, drop=0.0, link=None, seed=None):
+        super().__init__(daemon=True)
+        self.load = load
+        self.latency = latency
+        self.jitter = jitter
+        self.drop = drop
+        self.random = random.Random(seed)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        # Our own slave fd stays open so the pty survives clients reconnecting
+        self.path = os.ttyname(self.slave)
+        self.link = link
+        if link:
+            if os.path.islink(link):
+                os.remove(link)
+            os.symlink(self.path, link)
+        self.requests = 0
+        self.dropped = 0
+        self.garbage = 0
+        self.running = True
+
+    def run(self):
+        buffer = b""
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.2)
+            if not ready:
+                continue
+            try:
+                buffer += os.read(self.master, 256)
+            except OSError:
+                continue
+            while len(buffer) >= REQUEST_SIZE:
+                start = buffer.find(REQUEST_START)
+                if start < 0:
+                    # Keep a trailing B1, it may start the next request
+                    keep = 1 if buffer.endswith(REQUEST_START[:1]) else 0
+                    self.garbage += len(buffer) - keep
+                    buffer = buffer[len(buffer) - keep:]
+                    break
+                if start:
+                    self.garbage += start
+                    buffer = buffer[start:]
+                    continue
+                if buffer[REQUEST_SIZE - 1] != REQUEST_END:
+                    self.garbage += 1
+                    buffer = buffer[1:]
+                    continue
+                cmd, d1, d2 = buffer[2], buffer[3], buffer[4]
+                buffer = buffer[REQUEST_SIZE:]
+                self._reply(self.load.handle(cmd, d1, d2))
+
+    def _reply(self, reply):
+        self.requests += 1
+        if reply is None:
+            return
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if self.random.random() < self.drop:
+            self.dropped += 1
+            return
+        os.write(self.master, reply)
+
+    def close(self):
+        self.running = False
+        self.join(1.0)
+        if self.link and os.path.islink(self.link):
+            os.remove(self.link)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def report(self):
+        return (f"{self.path}: {self.requests} request(s), {self.dropped} reply(s) dropped, "
+                f"{self.garbage} garbage byte(s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="DL24 emulator on a pseudo-terminal")
+    parser.add_argument("--count", type=int, default=1, help="number of emulated devices (default 1)")
+    parser.add_argument("--link", help="symlink to the pty, e.g. /tmp/ttyDL24 (numbered if --count > 1)")
+    parser.add_argument("--latency", type=float, default=0.01, help="reply latency in s (default 0.01)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, up to this many s")
+    parser.add_argument("--drop", type=float, default=0.0, help="fraction of replies never sent (0..1)")
+    parser.add_argument("--capacity", type=float, default=2000.0, help="battery capacity in mAh (default 2000)")
+    parser.add_argument("--resistance", type=float, default=0.08, help="battery internal resistance in ohm")
+    parser.add_argument("--soc", type=float, default=1.0, help="initial state of charge 0..1 (default 1)")
+    parser.add_argument("--speed", type=float, default=1.0, help="run the battery and counters this much faster")
+    parser.add_argument("--seed", type=int, help="random seed for jitter and drops")
+    parser.add_argument("--status", type=float, default=5.0, help="print the state every N s (0 = never)")
+    args = parser.parse_args(argv)
+
+    servers = []
+    for i in range(args.count):
+        link = args.link if args.count == 1 or not args.link else f"{args.link}{i}"
+        load = EmulatedLoad(Battery(args.capacity, args.resistance, args.soc), args.speed)
+        seed = None if args.seed is None else args.seed + i
+        server = PtyServer(load, args.latency, args.jitter, args.drop, link, seed)
+        server.start()
+        servers.append(server)
+        print(f"Emulated DL24 on {server.path}" + (f" ({link})" if link else ""))
+    try:
+        while True:
+            time.sleep(args.status or 3600)
+            if args.status:
+                for server in servers:
+                    print(f"{server.path}: {server.load.status()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.close()
+            print(server.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import os
+import time
+import datetime
+import threading
+import importlib.util
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_script(name, filename):
+    """Import one of the scripts (their file names have spaces) as a module."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeDL24:
+    """
+    Stands in for dl24.DL24 on a port: a cell at 4 V with 50 mOhm internal
+    resistance, a constant current load and the voltage cutoff. Every read
+    takes `delay` seconds like a slow serial link.
+    """
+    delay = 0.001
+
+    def __init__(self, port):
+        self.port = port
+        self.on = False
+        self.current_limit = 1.0
+        self.cutoff = 0.0
+        self.timer = datetime.timedelta(0)
+        self.reads = 0
+        self.stepped = threading.Event()  # set_current() above 1 A was called
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def _read(self):
+        self.reads += 1
+        time.sleep(self.delay)
+
+    def get_voltage(self):
+        self._read()
+        voltage = 4.0 - (self.current_limit * 0.05 if self.on else 0.0)
+        if self.on and voltage < self.cutoff:
+            self.on = False
+        return voltage
+
+    def get_current(self):
+        self._read()
+        return self.current_limit if self.on else 0.0
+
+    def get_temp(self):
+        return 25
+
+    def get_energy(self):
+        return 0.0
+
+    def get_charge(self):
+        return 0.0
+
+    def get_time(self):
+        return datetime.timedelta(0)
+
+    def get_is_on(self):
+        return self.on
+
+    def get_current_limit(self):
+        return self.current_limit
+
+    def get_voltage_cutoff(self):
+        return self.cutoff
+
+    def get_timer(self):
+        return self.timer
+
+    def set_current(self, current):
+        self.current_limit = current
+        if current > 1.0:
+            self.stepped.set()
+
+    def set_voltage_cutoff(self, voltage):
+        self.cutoff = voltage
+
+    def set_timer(self, timer):
+        self.timer = timer
+
+    def enable(self):
+        self.on = True
+
+    def disable(self):
+        self.on = False
+
+    def reset_counters(self):
+        pass
+
+
+@pytest.fixture(scope="session")
+def app():
+    """The application module, with numpy and matplotlib loaded (no window is opened)."""
+    pytest.importorskip("dl24")
+    module = load_script("dl24_app", "DL24 electronic load V0.5.py")
+    module._import_gui()
+    return module
+
+
+@pytest.fixture
+def fake_dl24(app, monkeypatch):
+    """Every DL24Session of the test talks to a FakeDL24; returns the instances."""
+    devices = []
+
+    def make(port):
+        device = FakeDL24(port)
+        devices.append(device)
+        return device
+    monkeypatch.setattr(app, "DL24", make)
+    return devices
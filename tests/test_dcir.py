@@ -0,0 +1,49 @@
+import time
+
+
+def test_close_during_pulse_returns_quickly(app, fake_dl24):
+    device = app.DL24Device("COM_TEST", period=1.0)
+    results = []
+    dcir = app.DCIRTest(device.worker, high=2.0, window=0.2, interval=10.0, on_result=results.append)
+    dcir.start()
+    try:
+        # The first pulse starts right away; wait until it has stepped up
+        for _ in range(200):
+            if fake_dl24 and fake_dl24[0].stepped.is_set():
+                break
+            time.sleep(0.01)
+        assert fake_dl24[0].stepped.is_set()
+        t0 = time.monotonic()
+        device.close()
+        assert time.monotonic() - t0 < 1.0
+    finally:
+        device.close()
+    assert not device.worker.thread.is_alive()
+    assert not dcir.running
+    assert not fake_dl24[0].on
+    assert [result['pulse'] for result in results] == [1]
+
+
+def test_start_on_stopped_worker(app, fake_dl24):
+    device = app.DL24Device("COM_TEST", period=1.0)
+    device.close()
+    dcir = app.DCIRTest(device.worker, high=2.0, window=0.1)
+    dcir.start()
+    assert not dcir.running
+    assert dcir.pulses == 0
+
+
+def test_stop_reports_once(app, fake_dl24, capsys):
+    device = app.DL24Device("COM_TEST", period=1.0)
+    dcir = app.DCIRTest(device.worker, high=2.0, window=0.2, interval=10.0)
+    try:
+        dcir.start()
+        for _ in range(200):
+            if fake_dl24 and fake_dl24[0].stepped.is_set():
+                break
+            time.sleep(0.01)
+        dcir.stop()  # while the pulse is in progress
+        time.sleep(0.6)
+    finally:
+        device.close()
+    assert capsys.readouterr().out.count("DCIR:") == 1
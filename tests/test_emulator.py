@@ -0,0 +1,46 @@
+import time
+import datetime
+
+import pytest
+
+from conftest import load_script
+
+dl24 = pytest.importorskip("dl24")
+
+
+@pytest.fixture
+def emulator():
+    """A PtyServer running one EmulatedLoad 100 times faster than real time."""
+    module = load_script("dl24_emulator", "DL24 emulator.py")
+    server = module.PtyServer(module.EmulatedLoad(module.Battery(capacity_mah=2000.0), speed=100.0))
+    server.start()
+    yield server
+    server.close()
+
+
+def test_round_trip_with_the_dl24_library(emulator):
+    """The set-points come back as set, the readings match the emulator's own state."""
+    load = emulator.load
+    with dl24.DL24(emulator.path) as device:
+        device.set_current(1.5)
+        device.set_voltage_cutoff(2.75)
+        device.set_timer(datetime.timedelta(hours=1, minutes=30))
+        assert device.get_current_limit() == pytest.approx(1.5, abs=0.01)
+        assert device.get_voltage_cutoff() == pytest.approx(2.75, abs=0.01)
+        assert device.get_timer() == datetime.timedelta(hours=1, minutes=30)
+        assert (load.current_limit, load.cutoff, load.timer) == (pytest.approx(1.5), pytest.approx(2.75), 5400)
+
+        device.enable()
+        time.sleep(0.3)
+        assert device.get_is_on()
+        assert device.get_current() == pytest.approx(1.5, abs=0.001)
+        device.disable()
+        assert not device.get_is_on()
+
+        # Off, the counters stand still and can be compared exactly
+        assert load.charge > 5.0
+        assert device.get_voltage() == pytest.approx(load.voltage, abs=0.001)
+        assert device.get_charge() == pytest.approx(load.charge, abs=1.0)
+        assert device.get_energy() == pytest.approx(load.energy, abs=0.001)
+        assert device.get_time() == datetime.timedelta(seconds=int(load.seconds))
+        assert device.get_temp() == pytest.approx(load.temp, abs=1.0)
@@ -0,0 +1,83 @@
+import datetime
+
+import pytest
+
+
+def snapshot(app):
+    return app.Snapshot(datetime.datetime.now(), 0.0, 4.0, 1.0, 25, 0.1, 100.0, datetime.timedelta(seconds=10))
+
+
+def test_append_to_a_file_that_is_no_binary_log(app, tmp_path):
+    path = tmp_path / "run.dl24"
+    path.write_text("date,voltage\n")
+    with pytest.raises(ValueError):
+        app.output_logs(str(path), True, False, ["COM1"])
+
+
+def test_append_to_a_binary_log_of_other_ports(app, tmp_path):
+    path = tmp_path / "run.dl24"
+    logs = app.output_logs(str(path), False, True, ["COM1", "COM2"])
+    log = logs["COM1"]
+    log.attach()
+    log.add(snapshot(app), "COM1")
+    log.detach()
+    log.join(5.0)
+    with pytest.raises(ValueError):
+        app.output_logs(str(path), True, True, ["COM1", "COM3"])
+    with pytest.raises(ValueError):
+        app.output_logs(str(path), True, False, ["COM1"])
+    for log in set(app.output_logs(str(path), True, True, ["COM1", "COM2"]).values()):
+        log.attach()
+        log.detach()
+        log.join(5.0)
+        assert log.error is None
+
+
+def test_writer_stops_cleanly_on_a_bad_binary_log(app, tmp_path):
+    path = tmp_path / "run.dl24"
+    path.write_text("not a binary log\n")
+    errors = []
+    log = app.BinaryLog(str(path), True)  # output_logs() would have refused it
+    log.on_error = errors.append
+    log.attach()
+    log.add(snapshot(app), "COM1")
+    log.join(5.0)
+    assert not log.thread.is_alive()
+    assert log.closed
+    assert isinstance(log.error, ValueError)
+    assert errors == [log.error]
+    log.add(snapshot(app), "COM1")
+    assert log.backlog == 0
+
+
+def test_log_tail_of_a_port_the_log_does_not_have(app, tmp_path):
+    path = str(tmp_path / "run.dl24")
+    log = app.output_logs(path, False, True, ["COM1", "COM2"])["COM1"]
+    log.attach()
+    for port in ("COM1", "COM2"):
+        log.add(snapshot(app), port)
+    log.detach()
+    log.join(5.0)
+    assert len(app.read_log_tail(path, 10, "COM2")) == 1
+    with pytest.raises(ValueError):
+        app.read_log_tail(path, 10, "COM3")
+
+
+def test_log_tail_of_a_port_without_port_column(app, tmp_path):
+    path = str(tmp_path / "run.csv")
+    log = app.output_logs(path, False, False, ["COM1"])["COM1"]
+    log.attach()
+    log.add(snapshot(app), "COM1")
+    log.detach()
+    log.join(5.0)
+    assert len(app.read_log_tail(path, 10)) == 1
+    with pytest.raises(ValueError):
+        app.read_log_tail(path, 10, "COM1")
+
+
+def test_close_a_log_nobody_attached_to(app, tmp_path):
+    log = app.CsvLog(str(tmp_path / "run.csv"), False)
+    log.close()
+    log.join(5.0)
+    assert not log.thread.is_alive()
+    assert log.closed and log.error is None
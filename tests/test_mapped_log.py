@@ -0,0 +1,58 @@
+import csv
+import datetime
+
+import numpy as np
+import pytest
+
+ROWS = 6000  # per port
+T0 = datetime.datetime(2026, 1, 1, 12, 0, 0)
+
+
+def write_csv(app, path):
+    with open(path, "w", newline="") as f:
+        wr = csv.writer(f)
+        wr.writerow(app.CSV_HEADER + ['port'])
+        for i in range(ROWS):
+            for port, voltage in (("COM1", 3.0), ("COM2", 4.0)):
+                wr.writerow([(T0 + datetime.timedelta(seconds=i)).isoformat(sep=" "), voltage, 1.0, voltage,
+                             i, i, 25, i, "", port])
+
+
+def write_binary(app, path):
+    with open(path, "wb") as f:
+        app.write_binlog_header(f, ["COM1", "COM2"])
+        for i in range(ROWS):
+            for index, voltage in enumerate((3.0, 4.0)):
+                f.write(app.BIN_RECORD.pack(T0.timestamp() + i, voltage, 1.0, i, i, 25, i, index))
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".dl24"])
+@pytest.mark.parametrize("points", [3000, 1200, 7])
+def test_combined_log_even_stride(app, tmp_path, suffix, points):
+    path = str(tmp_path / ("combined" + suffix))
+    (write_csv if suffix == ".csv" else write_binary)(app, path)
+    log = app.MappedLog(path)
+    try:
+        assert log.ports == ["COM1", "COM2"]
+        # Past the last row: the range is all 2 * ROWS rows, an even stride
+        t0, t1 = log.time_at(0), log.time_at(log.count - 1) + 1
+        for port, voltage in (("COM1", 3.0), ("COM2", 4.0)):
+            data = log.read(t0, t1, points, port)
+            assert points // 2 <= len(data['t']) <= points + 1
+            assert np.all(data['voltage'] == voltage)
+            assert np.all(np.diff(data['t']) > 0)
+    finally:
+        log.close()
+
+
+def test_csv_index_is_cached_and_mapped(app, tmp_path):
+    path = str(tmp_path / "combined.csv")
+    write_csv(app, path)
+    log = app.MappedLog(path)
+    log.close()
+    log = app.MappedLog(path)
+    try:
+        assert isinstance(log.offsets, np.memmap)
+        assert log.count == 2 * ROWS
+    finally:
+        log.close()
@@ -0,0 +1,30 @@
+import json
+import time
+
+import pytest
+
+
+@pytest.mark.parametrize("profile", [[{"rest": 1}], 3, "steps", {"steps": [1, 2]},
+                                     {"steps": [{"pulse": [1, 2]}]}, {"steps": {"rest": 1}}])
+def test_load_rejects_malformed_profiles(app, tmp_path, profile):
+    path = tmp_path / "profile.json"
+    path.write_text(json.dumps(profile))
+    with pytest.raises(ValueError):
+        app.TestSequence.load(str(path))
+
+
+def test_close_stops_a_running_profile(app, fake_dl24):
+    device = app.DL24Device("COM_TEST", period=1.0)
+    events = []
+    device.sequence = app.TestSequence(device.worker, {"steps": [{"current": 1.5, "duration": 30}]},
+                                       on_event=events.append)
+    device.sequence.start()
+    for _ in range(200):
+        if fake_dl24 and fake_dl24[0].on:
+            break
+        time.sleep(0.01)
+    assert fake_dl24[0].on
+    device.close()
+    assert not device.sequence.running
+    assert not fake_dl24[0].on
+    assert events[-1]['event'] == "stopped"